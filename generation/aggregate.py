@@ -1,19 +1,40 @@
 import asyncio
+import hashlib
 import math
 
 import numpy as np
 from logging import getLogger
 from tqdm.asyncio import tqdm
 
+from ann_index import IvfIndex
+from cache import (
+    get_model_name_for_cache,
+    read_keybert_keywords_cache,
+    read_similar_courses_cache,
+    write_keybert_keywords_cache,
+    write_course_index_cache,
+    write_similar_courses_cache,
+)
 from course import Course
-from embeddings import get_model, get_embedding, get_keyword_model, CachedKeyBERT
+from embeddings import (
+    get_model,
+    get_course_embedding_registry,
+    get_keyword_model,
+    CachedKeyBERT,
+    top_k_similar,
+    update_top_k_similar,
+)
 from enrollment_data import GradeData
 from instructors import FullInstructor
+from keywords import extract_tfidf_keywords, keyword_overlap
 
 logger = getLogger(__name__)
 
 CROSS_LIST_MIN = 5
 
+# Course descriptions passed to KeyBERT per call
+keyword_chunk_size = 512
+
 
 def quick_statistics(
     course_ref_to_course: dict[Course.Reference, Course],
@@ -81,33 +102,15 @@ async def course_embedding_analysis(
 ):
     model = get_model(cache_dir)
 
-    async def embed_course(course_ref, course):
-        summary = course.get_short_summary()
-        # Wrap the synchronous get_embedding call in asyncio.to_thread if necessary.
-        embedding = await asyncio.to_thread(get_embedding, cache_dir, model, summary)
-
-        # Update progress safely using the lock.
-        return course_ref, embedding
-
-    # Create tasks for all courses.
-    tasks = [
-        embed_course(course_ref, course)
-        for course_ref, course in course_ref_to_course.items()
-    ]
-
-    # Await tasks concurrently.
-    results = await tqdm.gather(
-        *tasks, position=0, desc="Course Similarity Embedding Analysis", unit="course"
+    registry = await asyncio.to_thread(
+        get_course_embedding_registry, cache_dir, model, course_ref_to_course
     )
-
-    # Build the dictionary mapping course references to their embeddings.
-    course_embeddings = {course_ref: embedding for course_ref, embedding in results}
-    logger.info("Course embeddings pulled for %d courses", len(course_embeddings))
+    logger.info("Course embeddings pulled for %d courses", len(registry.course_refs))
 
     # --- Vectorized Nearest Neighbor Computation ---
-    # Prepare an ordered list of course references and a corresponding NumPy matrix of embeddings.
-    course_refs = list(course_embeddings.keys())
-    embeddings = np.stack([course_embeddings[ref] for ref in course_refs])
+    # The registry's course references, aligned with the rows of its embedding matrix.
+    course_refs = registry.course_refs
+    embeddings = registry.matrix
 
     # For filtering purposes, extract the course numbers.
     # (Assumes each course_ref has an attribute 'course_number'.)
@@ -120,24 +123,47 @@ async def course_embedding_analysis(
     # Create a global mask: only consider courses within the [min_cc, max_cc] range.
     allowed_mask = (course_numbers >= min_cc) & (course_numbers <= max_cc)
 
-    # Compute the full similarity matrix between all courses.
-    # (Assumes the embeddings are normalized so that cosine similarity = dot product.)
-    similarity_matrix = np.dot(embeddings, embeddings.T)
-
-    # For each course, disqualify courses that do not satisfy the filter by setting their similarity to -∞.
-    similarity_matrix[:, ~allowed_mask] = -np.inf
-    # Remove self similarity by setting the diagonal to -∞.
-    np.fill_diagonal(similarity_matrix, -np.inf)
-
-    # For each row in the similarity matrix, use argpartition to get the indices of the top k similar courses.
-    top_k_indices = np.argpartition(similarity_matrix, -k, axis=1)[:, -k:]
-    # Optionally sort these indices to order by descending similarity.
-    sorted_top_k_indices = np.array(
-        [
-            indices[np.argsort(similarity_matrix[i, indices])[::-1]]
-            for i, indices in enumerate(top_k_indices)
-        ]
+    # Find the top k similar courses of each course, reusing the previous run's for
+    # courses whose summaries did not change.
+    identifiers = [ref.get_identifier() for ref in course_refs]
+    model_name = get_model_name_for_cache(model)
+    summary_hashes = [
+        hashlib.sha256(f"{model_name}\n{summary_hash}".encode()).hexdigest()
+        for summary_hash in registry.hashes
+    ]
+    sorted_top_k_indices, top_k_similarities = update_top_k_similar(
+        embeddings,
+        k,
+        identifiers,
+        summary_hashes,
+        allowed_mask=allowed_mask,
+        previous=read_similar_courses_cache(cache_dir),
     )
+    write_similar_courses_cache(
+        cache_dir,
+        {
+            "keys": np.array(identifiers),
+            "hashes": np.array(summary_hashes),
+            "neighbors": np.array(identifiers)[sorted_top_k_indices],
+            "similarities": top_k_similarities,
+        },
+    )
+
+    # Approximate nearest neighbor index over the course embeddings, kept in the cache
+    course_index = IvfIndex.build(identifiers, embeddings)
+    recall_sample = np.random.default_rng(0).choice(
+        len(identifiers), min(1000, len(identifiers)), replace=False
+    )
+    exact_indices, _ = top_k_similar(embeddings, k, query_indices=recall_sample)
+    recall = course_index.recall(
+        {
+            identifiers[i]: [identifiers[j] for j in neighbors]
+            for i, neighbors in zip(recall_sample, exact_indices)
+        },
+        k,
+    )
+    logger.info(f"Course index recall@{k} against exact search: {recall:.2%}")
+    write_course_index_cache(cache_dir, course_index)
 
     # Build a mapping from each course reference to its corresponding top k similar course references.
     similar_courses_mapping = {}
@@ -156,36 +182,79 @@ async def course_embedding_analysis(
 
 
 async def define_keywords(
-    course_ref_to_course: dict[Course.Reference, Course], cache_dir
+    course_ref_to_course: dict[Course.Reference, Course],
+    cache_dir,
+    keyword_engine="keybert",
 ):
+    courses = [
+        course
+        for course in sorted(
+            course_ref_to_course.values(), key=lambda c: c.get_identifier()
+        )
+        if course.description.strip()
+    ]
+    descriptions = [course.description.strip() for course in courses]
+
+    # TF-IDF keywords are cheap, so they are always computed for the overlap report
+    tfidf_keywords = await asyncio.to_thread(extract_tfidf_keywords, descriptions)
+    identifier_to_tfidf_keywords = {
+        course.get_identifier(): keywords
+        for course, keywords in zip(courses, tfidf_keywords)
+    }
+
+    if keyword_engine == "tfidf":
+        for course, keywords in zip(courses, tfidf_keywords):
+            course.keywords = keywords
+
+        identifier_to_keybert_keywords = read_keybert_keywords_cache(cache_dir)
+        if identifier_to_keybert_keywords:
+            log_keyword_overlap(
+                identifier_to_keybert_keywords, identifier_to_tfidf_keywords
+            )
+        return
+
     # Load the all-MiniLM-L6-v2 model with custom caching
     keyword_model = get_keyword_model(cache_dir)
     kw_model = CachedKeyBERT(cache_dir, keyword_model)
 
-    def set_keywords(course: Course):
-        description = course.description.strip()
+    def set_keywords():
+        # Documents are processed in chunks, which share candidate phrase embeddings
+        # through the embedding cache
+        for start in tqdm(
+            range(0, len(courses), keyword_chunk_size),
+            desc="Extracting Keywords",
+            unit="chunk",
+        ):
+            chunk = courses[start : start + keyword_chunk_size]
+            chunk_keywords = kw_model.extract_keywords(
+                descriptions[start : start + keyword_chunk_size],
+                keyphrase_ngram_range=(1, 2),
+                stop_words="english",
+                top_n=5,
+                use_maxsum=True,
+                nr_candidates=10,
+            )
 
-        if not description:
-            return
+            for course, keywords in zip(chunk, chunk_keywords):
+                course.keywords = [keyword[0] for keyword in keywords]
 
-        keywords = kw_model.extract_keywords(
-            description,
-            keyphrase_ngram_range=(1, 2),
-            stop_words="english",
-            top_n=5,
-            use_maxsum=True,
-            nr_candidates=10,
-        )
+    await asyncio.to_thread(set_keywords)
 
-        actual_keywords = [keyword[0] for keyword in keywords]
-        course.keywords = actual_keywords
+    identifier_to_keybert_keywords = {
+        course.get_identifier(): course.keywords for course in courses
+    }
+    write_keybert_keywords_cache(cache_dir, identifier_to_keybert_keywords)
+    log_keyword_overlap(identifier_to_keybert_keywords, identifier_to_tfidf_keywords)
 
-    tasks = [
-        asyncio.to_thread(set_keywords, course)
-        for course in course_ref_to_course.values()
-    ]
 
-    await tqdm.gather(*tasks, desc="Extracting Keywords", unit="course")
+def log_keyword_overlap(identifier_to_keybert_keywords, identifier_to_tfidf_keywords):
+    overlap = keyword_overlap(
+        identifier_to_keybert_keywords, identifier_to_tfidf_keywords
+    )
+    logger.info(
+        "TF-IDF keyword overlap with KeyBERT: "
+        + ", ".join(f"{name}={value}" for name, value in overlap.items())
+    )
 
 
 def aggregate_subject_stats(course_ref_to_course: dict[Course.Reference, Course]):
@@ -290,7 +359,10 @@ def determine_a_rate_chance(course_ref_to_course: dict[Course.Reference, Course]
 
 
 def aggregate_courses(
-    course_ref_to_course: dict[Course.Reference, Course], instructors, cache_dir
+    course_ref_to_course: dict[Course.Reference, Course],
+    instructors,
+    cache_dir,
+    keyword_engine="keybert",
 ):
     determine_satisfies(course_ref_to_course)
 
@@ -300,7 +372,7 @@ def aggregate_courses(
     qs["top_100_a_rate_chances"] = determine_a_rate_chance(course_ref_to_course)
 
     asyncio.run(course_embedding_analysis(course_ref_to_course, cache_dir))
-    asyncio.run(define_keywords(course_ref_to_course, cache_dir))
+    asyncio.run(define_keywords(course_ref_to_course, cache_dir, keyword_engine))
 
     return qs, stats
 
@@ -1,6 +1,10 @@
-from aiohttp_client_cache import SQLiteBackend
+import asyncio
+
+from aiohttp_client_cache import CachedSession, SQLiteBackend
 from requests_cache import NEVER_EXPIRE
 
+import http_replay
+
 _aio_cache_config = {
     "cache_name": None,
     "expire_after": NEVER_EXPIRE,
@@ -20,3 +24,44 @@ def get_aio_cache():
     if _aio_cache_config["cache_name"] is None:
         raise ValueError("AIO cache location not set")
     return SQLiteBackend(**_aio_cache_config)
+
+
+_in_flight_requests: dict[tuple[str, str], asyncio.Event] = {}
+
+
+class CoalescingCachedSession(CachedSession):
+    """
+    CachedSession that coalesces identical in-flight requests (single-flight).
+
+    The first request for a cache key goes to the network, while identical requests
+    issued before it completes, from any session sharing the same cache, wait for it
+    and are then served from the cache. If the first response was not cacheable, the
+    waiting requests fall through to the network.
+    """
+
+    async def _request(self, method, str_or_url, **kwargs):
+        if http_replay.is_replaying(str_or_url):
+            return await http_replay.replay_aio_request(method, str_or_url, **kwargs)
+
+        response = await self._coalesced_request(method, str_or_url, **kwargs)
+        if http_replay.is_recording(str_or_url):
+            await http_replay.record_aio_response(method, str_or_url, kwargs, response)
+        return response
+
+    async def _coalesced_request(self, method, str_or_url, **kwargs):
+        if self.cache.disabled:
+            return await super()._request(method, str_or_url, **kwargs)
+
+        key = (self.cache.name, self.cache.create_key(method, str_or_url, **kwargs))
+        in_flight = _in_flight_requests.get(key)
+        if in_flight is not None:
+            await in_flight.wait()
+            return await super()._request(method, str_or_url, **kwargs)
+
+        done = asyncio.Event()
+        _in_flight_requests[key] = done
+        try:
+            return await super()._request(method, str_or_url, **kwargs)
+        finally:
+            del _in_flight_requests[key]
+            done.set()
@@ -0,0 +1,160 @@
+"""
+Inverted file (IVF) approximate nearest neighbor index over embeddings, in NumPy.
+
+Embeddings are normalized and clustered with spherical k-means. Each query is only
+compared against the embeddings of its `n_probe` closest clusters, so a k-NN query over
+the course catalog takes well under a millisecond without loading or scanning the
+full matrix of course embeddings.
+"""
+
+from logging import getLogger
+
+import numpy as np
+
+logger = getLogger(__name__)
+
+
+def normalize_rows(embeddings) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def spherical_kmeans(embeddings, n_clusters: int, iterations=15, seed=0):
+    """
+    Clusters normalized embeddings by cosine similarity.
+
+    Returns:
+        Tuple of (unit-length centroids, cluster of each embedding)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = embeddings[rng.choice(len(embeddings), n_clusters, replace=False)]
+    assignments = np.zeros(len(embeddings), dtype=np.intp)
+
+    for _ in range(iterations):
+        assignments = np.argmax(embeddings @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, embeddings)
+
+        # Clusters left empty are restarted from random embeddings
+        empty = np.bincount(assignments, minlength=n_clusters) == 0
+        sums[empty] = embeddings[rng.choice(len(embeddings), empty.sum())]
+        centroids = normalize_rows(sums)
+
+    return centroids, np.argmax(embeddings @ centroids.T, axis=1)
+
+
+class IvfIndex:
+    """
+    IVF index with cosine similarity.
+
+    Embeddings are stored grouped by cluster, so that the embeddings of cluster `c`
+    are `vectors[offsets[c]:offsets[c + 1]]`, and `ids` are the keys (e.g. course
+    identifiers) of the stored embeddings in the same order.
+    """
+
+    def __init__(self, ids, vectors, centroids, offsets, n_probe: int):
+        self.ids = np.asarray(ids)
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.intp)
+        self.n_probe = int(n_probe)
+        self.id_to_position = {key: i for i, key in enumerate(self.ids.tolist())}
+
+    @classmethod
+    def build(cls, ids, embeddings, n_lists=None, n_probe=None, seed=0):
+        """
+        Args:
+            ids: Keys of the embeddings
+            embeddings: Matrix with one embedding per row
+            n_lists: Number of clusters (defaults to the square root of the count)
+            n_probe: Clusters searched per query (defaults to an eighth of them)
+        """
+        vectors = normalize_rows(embeddings)
+        n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        n_probe = n_probe or max(1, n_lists // 8)
+
+        centroids, assignments = spherical_kmeans(vectors, n_lists, seed=seed)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignments, minlength=n_lists))]
+        )
+
+        logger.info(
+            f"Built IVF index of {len(vectors)} embeddings in {n_lists} lists, probing {n_probe}."
+        )
+        return cls(np.asarray(ids)[order], vectors[order], centroids, offsets, n_probe)
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> "IvfIndex":
+        return cls(
+            ids=arrays["ids"],
+            vectors=arrays["vectors"],
+            centroids=arrays["centroids"],
+            offsets=arrays["offsets"],
+            n_probe=arrays["n_probe"],
+        )
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {
+            "ids": self.ids,
+            "vectors": self.vectors.astype(np.float16),
+            "centroids": self.centroids,
+            "offsets": self.offsets,
+            "n_probe": np.array(self.n_probe),
+        }
+
+    def search(self, query, k: int, n_probe=None, exclude=None):
+        """
+        Finds the approximate k most similar stored embeddings of a query.
+
+        Args:
+            query: Query embedding, normalized here
+            n_probe: Clusters to search (defaults to the index's)
+            exclude: Optional key never to return, such as the query's own
+
+        Returns:
+            Tuple of (keys, similarities), most similar first
+        """
+        query = normalize_rows(np.atleast_2d(query))[0]
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        clusters = np.argpartition(self.centroids @ query, -n_probe)[-n_probe:]
+
+        positions = np.concatenate(
+            [
+                np.arange(self.offsets[cluster], self.offsets[cluster + 1])
+                for cluster in clusters
+            ]
+        )
+        if exclude is not None and exclude in self.id_to_position:
+            positions = positions[positions != self.id_to_position[exclude]]
+
+        similarities = self.vectors[positions] @ query
+        k = min(k, len(positions))
+        top = np.argpartition(similarities, -k)[-k:] if k else np.array([], np.intp)
+        top = top[np.lexsort((positions[top], -similarities[top]))]
+        return self.ids[positions[top]], similarities[top]
+
+    def search_id(self, key, k: int, n_probe=None):
+        """Finds the approximate k most similar stored embeddings of a stored one."""
+        return self.search(
+            self.vectors[self.id_to_position[key]], k, n_probe=n_probe, exclude=key
+        )
+
+    def recall(self, exact_neighbors: dict, k: int, n_probe=None) -> float:
+        """
+        Args:
+            exact_neighbors: Mapping of stored keys to the keys of their exact k most
+                similar embeddings, excluding themselves
+
+        Returns:
+            Fraction of the exact neighbors the index also returns
+        """
+        found = 0
+        total = 0
+        for key, neighbors in exact_neighbors.items():
+            approximate, _ = self.search_id(key, k, n_probe=n_probe)
+            found += len(set(approximate.tolist()) & set(neighbors))
+            total += len(neighbors)
+        return found / total if total else 1.0
@@ -1,13 +1,15 @@
 import json
 import os
 from logging import getLogger
+from zipfile import BadZipFile
 
 import numpy as np
 
+from ann_index import IvfIndex
 from course import Course
-from enrollment_data import EnrollmentData
+from enrollment_data import EnrollmentData, MadgradesData
 from instructors import FullInstructor
-from save import write_file, format_file_size
+from save import write_arrays, write_file, format_file_size
 
 logger = getLogger(__name__)
 
@@ -79,6 +81,29 @@ def write_graphs_cache(
     write_file(cache_dir, ("graphs",), "color_map", color_map)
 
 
+def write_course_ref_to_madgrades_cache(cache_dir, course_ref_to_madgrades):
+    write_file(cache_dir, (), "madgrades", course_ref_to_madgrades)
+
+
+def read_course_ref_to_madgrades_cache(cache_dir):
+    """
+    Reads the per-course Madgrades data stored by previous runs.
+
+    Parameters:
+        cache_dir (str): Directory where the cache is stored.
+
+    Returns:
+        dict: Mapping of course references to MadgradesData, or empty dict if not found.
+    """
+    course_ref_to_madgrades = read_cache(cache_dir, (), "madgrades")
+    if course_ref_to_madgrades is None:
+        return {}
+    return {
+        Course.Reference.from_string(key): MadgradesData.from_json(value)
+        for key, value in course_ref_to_madgrades.items()
+    }
+
+
 def read_course_ref_to_course_cache(cache_dir):
     str_course_ref_to_course = read_cache(cache_dir, (), "courses")
     return {
@@ -87,6 +112,22 @@ def read_course_ref_to_course_cache(cache_dir):
     }
 
 
+def write_requisite_parse_memo_cache(cache_dir, parse_memo):
+    write_file(cache_dir, (), "requisite_parses", parse_memo)
+
+
+def read_requisite_parse_memo_cache(cache_dir):
+    return read_cache(cache_dir, (), "requisite_parses")
+
+
+def write_keybert_keywords_cache(cache_dir, identifier_to_keywords):
+    write_file(cache_dir, (), "keybert_keywords", identifier_to_keywords)
+
+
+def read_keybert_keywords_cache(cache_dir):
+    return read_cache(cache_dir, (), "keybert_keywords")
+
+
 def read_terms_cache(cache_dir):
     str_terms = read_cache(cache_dir, (), "terms")
     if str_terms is None:
@@ -208,6 +249,58 @@ def read_embedding(directory: str, directory_tuple: tuple[str, ...], filename: s
         return None
 
 
+def read_arrays(directory: str, directory_tuple: tuple[str, ...], filename: str):
+    """
+    Reads a dictionary of numpy arrays from an .npz file.
+
+    Parameters:
+        directory (str): Base directory where the file is stored.
+        directory_tuple (tuple[str, ...]): Tuple representing subdirectories.
+        filename (str): Name of the file (without the .npz extension).
+
+    Returns:
+        Dictionary of array names to arrays, or None if the file does not exist.
+    """
+    sanitized_filename = filename.replace("/", "_").replace(" ", "_")
+    file_path = os.path.join(directory, *directory_tuple, f"{sanitized_filename}.npz")
+
+    if not os.path.exists(file_path):
+        logger.debug(f"Arrays file {file_path} does not exist.")
+        return None
+
+    try:
+        with np.load(file_path) as arrays:
+            return dict(arrays)
+    except (FileNotFoundError, ValueError, KeyError, BadZipFile) as e:
+        # Missing, truncated or not a valid .npz file
+        logger.warning(f"Failed to load arrays from {file_path}: {e}")
+        return None
+
+
+def write_course_index_cache(cache_dir, course_index: IvfIndex):
+    write_arrays(cache_dir, ("embeddings",), "course_index", course_index.to_arrays())
+
+
+def write_similar_courses_cache(cache_dir, similar_courses):
+    write_arrays(cache_dir, ("embeddings",), "similar_courses", similar_courses)
+
+
+def read_similar_courses_cache(cache_dir):
+    return read_arrays(cache_dir, ("embeddings",), "similar_courses")
+
+
+def write_course_embeddings_cache(cache_dir, model, course_embeddings):
+    model_name = get_model_name_for_cache(model)
+    write_arrays(
+        cache_dir, ("embeddings", model_name), "course_embeddings", course_embeddings
+    )
+
+
+def read_course_embeddings_cache(cache_dir, model):
+    model_name = get_model_name_for_cache(model)
+    return read_arrays(cache_dir, ("embeddings", model_name), "course_embeddings")
+
+
 def get_model_name_for_cache(model):
     """
     Extract a safe model name for caching purposes.
@@ -289,6 +382,37 @@ def write_embedding_cache(cache_dir, sha256hash: str, embedding, model):
     write_embedding(cache_dir, directory_tuple, sha256hash, embedding)
 
 
+def read_embedding_caches(cache_dir, sha256hashes, model) -> dict[str, np.ndarray]:
+    """
+    Read many cached embeddings at once, listing the model's cache directory once
+    instead of checking for every file.
+
+    Args:
+        cache_dir: Cache directory
+        sha256hashes: Hashes of the texts
+        model: Model instance for per-model caching
+
+    Returns:
+        Mapping of the hashes found in the cache to their embeddings
+    """
+    model_name = get_model_name_for_cache(model)
+    directory_path = os.path.join(cache_dir, "embeddings", model_name)
+    if not os.path.isdir(directory_path):
+        return {}
+
+    with os.scandir(directory_path) as entries:
+        cached_files = {entry.name for entry in entries}
+
+    embeddings = {}
+    for sha256hash in sha256hashes:
+        if f"{sha256hash}.npy" not in cached_files:
+            continue
+        embedding = read_embedding(cache_dir, ("embeddings", model_name), sha256hash)
+        if embedding is not None:
+            embeddings[sha256hash] = embedding
+    return embeddings
+
+
 def write_new_terms_cache(cache_dir, new_terms):
     """
     Writes new terms to the cache.
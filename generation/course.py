@@ -5,11 +5,7 @@ from bs4 import NavigableString
 
 from enrollment_data import GradeData, TermData
 from json_serializable import JsonSerializable
-from requirement_ast import (
-    RequirementAbstractSyntaxTree,
-    tokenize_requisites,
-    RequirementParser,
-)
+from requirement_ast import RequirementAbstractSyntaxTree, parse_requisites
 
 
 def remove_extra_spaces(text: str):
@@ -293,13 +289,8 @@ class Course(JsonSerializable):
             else:
                 linked_requisite_text.append(node.get_text(strip=True))
 
-        tokens = tokenize_requisites(linked_requisite_text)
-
-        parser = RequirementParser(tokens)
-        tree = None
-        try:
-            tree = parser.parse()
-        except SyntaxError as se:
+        tree, se = parse_requisites(linked_requisite_text)
+        if se is not None:
             logger.warning(
                 f"Syntax error in course {course_reference}: {se}. See text: {requisites_text}"
             )
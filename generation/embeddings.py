@@ -1,18 +1,33 @@
 import asyncio
 import hashlib
+import heapq
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
 from os import environ
 
 import numpy as np
 import requests_cache
+import torch
 from sentence_transformers import SentenceTransformer
 from torch import cuda
 from tqdm.asyncio import tqdm
 
-from cache import read_embedding_cache, write_embedding_cache
+from cache import (
+    get_model_name_for_cache,
+    read_course_embeddings_cache,
+    read_embedding_cache,
+    read_embedding_caches,
+    write_course_embeddings_cache,
+    write_embedding_cache,
+)
 from course import Course
+from inference import inference_executor
+from prerequisite_evaluator import PrerequisiteEvaluator
+from requirement_ast import Leaf
+from timer import get_ms
 
 logger = getLogger(__name__)
 
@@ -20,6 +35,10 @@ logger = getLogger(__name__)
 class CachedKeyBERT:
     """
     Custom KeyBERT wrapper that uses our embedding caching system.
+
+    Documents and candidate phrases are embedded up front in deduplicated batches
+    through `get_embeddings` and handed to KeyBERT, instead of replacing the shared
+    model's `encode` method, so the wrapper never modifies the model.
     """
 
     def __init__(self, cache_dir, model):
@@ -30,69 +49,94 @@ class CachedKeyBERT:
         # Create KeyBERT with our custom model
         self.keybert = KeyBERT(model=model)
 
-    def extract_keywords(self, docs, **kwargs):
+    def extract_keywords(
+        self,
+        docs,
+        keyphrase_ngram_range=(1, 1),
+        stop_words="english",
+        min_df=1,
+        **kwargs,
+    ):
         """
         Extract keywords using KeyBERT but with cached embeddings.
-        This method intercepts KeyBERT's internal embedding calls.
+
+        Args:
+            docs: A document, or a list of documents to extract keywords from at once
+
+        Returns:
+            The keywords of the document, or a list of keywords per document
         """
-        # Store original encode method
-        original_encode = self.model.encode
-
-        def cached_encode(sentences, **encode_kwargs):
-            # If it's a single string, convert to list
-            if isinstance(sentences, str):
-                sentences = [sentences]
-                single_input = True
-            else:
-                single_input = False
+        from sklearn.feature_extraction.text import CountVectorizer
 
-            # Get cached embeddings for each sentence
-            embeddings = []
-            for sentence in sentences:
-                sha256 = hashlib.sha256(sentence.encode()).hexdigest()
+        single_input = isinstance(docs, str)
+        docs = [docs] if single_input else list(docs)
 
-                # Check if the embedding already exists (with model-specific caching)
-                embedding = read_embedding_cache(self.cache_dir, sha256, self.model)
+        # KeyBERT fits the same vectorizer on the documents, so the candidate phrases
+        # here line up with its vocabulary
+        try:
+            vectorizer = CountVectorizer(
+                ngram_range=keyphrase_ngram_range, stop_words=stop_words, min_df=min_df
+            ).fit(docs)
+        except ValueError:
+            # Only stop words, or no words at all
+            return [] if single_input else [[] for _ in docs]
+        candidates = vectorizer.get_feature_names_out().tolist()
+
+        doc_embeddings = np.array(
+            get_embeddings(
+                self.cache_dir, self.model, docs, "Keyword Documents", memoize=False
+            )
+        )
+        word_embeddings = np.array(
+            get_embeddings(
+                self.cache_dir,
+                self.model,
+                candidates,
+                "Keyword Candidates",
+                memoize=False,
+            )
+        )
 
-                if embedding is None:
-                    # Use original encode method to avoid recursion
-                    embedding = original_encode(sentence, show_progress_bar=False)
-                    logger.debug(
-                        f"Embedding for '{sentence}' not found in cache. Caching it now."
-                    )
-                    write_embedding_cache(self.cache_dir, sha256, embedding, self.model)
+        keywords = self.keybert.extract_keywords(
+            docs,
+            keyphrase_ngram_range=keyphrase_ngram_range,
+            stop_words=stop_words,
+            min_df=min_df,
+            doc_embeddings=doc_embeddings,
+            word_embeddings=word_embeddings,
+            **kwargs,
+        )
 
-                embeddings.append(embedding)
+        # KeyBERT unwraps the keywords of a single document
+        if len(docs) == 1 and not single_input:
+            return [keywords]
+        return keywords
 
-            embeddings = np.array(embeddings)
 
-            # Return single embedding if input was single string
-            if single_input:
-                return embeddings[0]
-            return embeddings
+embedding_model_name = "avsolatorio/GIST-large-Embedding-v0"
 
-        # Temporarily replace the model's encode method
-        self.model.encode = cached_encode
+# Inference precisions of the embedding model. Reduced precisions only apply on CPU,
+# and cache their embeddings separately from fp32.
+model_precisions = ("fp32", "int8", "bf16")
+model_precision = "fp32"
 
-        try:
-            # Call KeyBERT with our cached encoding
-            result = self.keybert.extract_keywords(docs, **kwargs)
-        finally:
-            # Restore original encode method
-            self.model.encode = original_encode
+initialized_models = {}
 
-        return result
 
+def set_model_precision(precision: str):
+    global model_precision
 
-initialized_model = None
+    if precision not in model_precisions:
+        raise ValueError(f"Unknown model precision {precision!r}")
+    model_precision = precision
 
 
-def get_model(cache_dir):
-    global initialized_model
+def get_model(cache_dir, precision: str | None = None):
+    precision = precision or model_precision
 
-    if initialized_model:
+    if precision in initialized_models:
         logger.info("Model already loaded. Reusing the existing model.")
-        return initialized_model
+        return initialized_models[precision]
 
     # Disable HTTP request caching to ensure the model is fetched or initialized correctly.
     with requests_cache.disabled():
@@ -117,16 +161,153 @@ def get_model(cache_dir):
 
         logger.info("Loading model...")
         model = SentenceTransformer(
-            model_name_or_path="avsolatorio/GIST-large-Embedding-v0",
+            model_name_or_path=embedding_model_name,
             cache_folder=model_cache_dir,
             trust_remote_code=True,
             device=device,
         )
 
-        initialized_model = model
+        if precision != "fp32":
+            if device != "cpu":
+                logger.warning(
+                    f"{precision} inference is only supported on CPU. Using fp32 on {device}."
+                )
+            else:
+                reduce_model_precision(model, precision)
+
+        initialized_models[precision] = model
         return model
 
 
+def reduce_model_precision(model: SentenceTransformer, precision: str):
+    """
+    Converts a CPU model in place to int8 (dynamically quantized linear layers) or
+    bf16 inference, and gives it its own embedding cache name.
+    """
+    if precision == "int8":
+        logger.info("Quantizing model linear layers to int8...")
+        torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    elif precision == "bf16":
+        logger.info("Converting model to bf16...")
+        model.to(torch.bfloat16)
+    else:
+        raise ValueError(f"Unknown model precision {precision!r}")
+
+    # Keeps reduced precision embeddings from mixing with fp32 ones in the cache
+    model.model_name = f"{embedding_model_name}-{precision}"
+
+
+def compare_model_precision(
+    cache_dir,
+    course_ref_to_course: dict[Course.Reference, Course],
+    precision: str,
+    max_prerequisites: int,
+    k=5,
+    sample_size=1000,
+):
+    """
+    Measures how much a reduced precision model changes our results, against fp32.
+
+    For a fixed sample of courses, compares their k nearest neighbors over the whole
+    catalog and the prerequisite branch the optimize step would select.
+
+    Returns:
+        Dictionary of agreement metrics
+    """
+    reference_model = get_model(cache_dir, "fp32")
+    candidate_model = get_model(cache_dir, precision)
+
+    time_start = time.time()
+    reference_registry = get_course_embedding_registry(
+        cache_dir, reference_model, course_ref_to_course
+    )
+    reference_time = get_ms(time_start)
+    time_start = time.time()
+    candidate_registry = get_course_embedding_registry(
+        cache_dir, candidate_model, course_ref_to_course
+    )
+    candidate_time = get_ms(time_start)
+
+    course_refs = reference_registry.course_refs
+    reference = reference_registry.matrix.astype(np.float32)
+    candidate = candidate_registry.matrix.astype(np.float32)
+
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate /= np.linalg.norm(candidate, axis=1, keepdims=True)
+
+    rng = np.random.default_rng(0)
+    sample = np.sort(
+        rng.choice(len(course_refs), min(sample_size, len(course_refs)), replace=False)
+    )
+
+    reference_neighbors, _ = top_k_similar(reference, k, query_indices=sample)
+    candidate_neighbors, _ = top_k_similar(candidate, k, query_indices=sample)
+    neighbor_overlap = np.mean(
+        [
+            len(set(a) & set(b)) / k
+            for a, b in zip(reference_neighbors, candidate_neighbors)
+        ]
+    )
+    top_1_agreement = np.mean(reference_neighbors[:, 0] == candidate_neighbors[:, 0])
+
+    max_enrollment = max(
+        (
+            c.cumulative_grade_data.total
+            for c in course_ref_to_course.values()
+            if c.cumulative_grade_data
+        ),
+        default=1,
+    )
+    selections = 0
+    selection_agreements = 0
+    for index in sample:
+        course = course_ref_to_course[course_refs[index]]
+        if (
+            not course.prerequisites
+            or not course.prerequisites.abstract_syntax_tree
+            or len(course.prerequisites.course_references) <= max_prerequisites
+        ):
+            continue
+
+        branches = [
+            find_best_branches(
+                cache_dir=cache_dir,
+                model=model,
+                course=course,
+                course_ref_to_course=course_ref_to_course,
+                max_enrollment=max_enrollment,
+                semantic_similarity_weight=0.5,
+                popularity_weight=0.5,
+            )
+            for model in (reference_model, candidate_model)
+        ]
+        best = [set(b[0][1]) if b else None for b in branches]
+        selections += 1
+        selection_agreements += best[0] == best[1]
+
+    report = {
+        "precision": precision,
+        "courses": len(course_refs),
+        "sampled_courses": len(sample),
+        "mean_cosine_to_fp32": float(np.mean(np.sum(reference * candidate, axis=1))),
+        f"neighbor_overlap_at_{k}": float(neighbor_overlap),
+        "top_1_neighbor_agreement": float(top_1_agreement),
+        "prerequisite_selections": selections,
+        "prerequisite_selection_agreement": selection_agreements / selections
+        if selections
+        else None,
+        "fp32_embedding_time": reference_time,
+        f"{precision}_embedding_time": candidate_time,
+    }
+    logger.info(
+        f"{precision} agreement with fp32: "
+        + ", ".join(f"{name}={value}" for name, value in report.items())
+    )
+    return report
+
+
 def get_keyword_model(cache_dir):
     """
     Load the all-MiniLM-L6-v2 model for keyword extraction with custom caching.
@@ -162,25 +343,388 @@ def get_keyword_model(cache_dir):
         return model
 
 
+# Texts encoded per model.encode call, and per progress update, when batch embedding
+embedding_batch_size = 32
+embedding_chunk_size = 512
+
+# Embeddings already resolved during this run, keyed by (model name, text hash)
+_embedding_memo: dict[tuple[str, str], np.ndarray] = {}
+
+
 def get_embedding(cache_dir, model: SentenceTransformer, text):
     sha256 = hashlib.sha256(text.encode()).hexdigest()
+    memo_key = (get_model_name_for_cache(model), sha256)
+    embedding = _embedding_memo.get(memo_key)
+    if embedding is not None:
+        return embedding
 
     # Check if the embedding already exists (with model-specific caching)
     embedding = read_embedding_cache(cache_dir, sha256, model)
 
     if embedding is None:
-        embedding = model.encode(text, show_progress_bar=False)
+        embedding = inference_executor.encode(model, text, show_progress_bar=False)
 
         logger.debug(f"Embedding for '{text}' not found in cache. Caching it now.")
         write_embedding_cache(cache_dir, sha256, embedding, model)
 
+    _embedding_memo[memo_key] = embedding
     return embedding
 
 
+def get_embeddings(
+    cache_dir, model: SentenceTransformer, texts, desc="Embedding", memoize=True
+) -> list[np.ndarray]:
+    """
+    Batch version of `get_embedding`.
+
+    Texts are deduplicated, cache hits are read in bulk, and misses are encoded in
+    batches of `embedding_batch_size`, shortest first so that batches need little
+    padding. Resolved embeddings are kept in memory, so later `get_embedding` calls
+    for the same texts don't touch the disk.
+
+    Args:
+        memoize: Whether to keep the embeddings in memory, which large sets of
+            one-off texts (e.g. keyword candidates) should skip
+
+    Returns:
+        Embeddings aligned with `texts`
+    """
+    model_name = get_model_name_for_cache(model)
+    text_to_sha256 = {
+        text: hashlib.sha256(text.encode()).hexdigest() for text in dict.fromkeys(texts)
+    }
+
+    sha256_to_embedding = {
+        sha256: _embedding_memo[(model_name, sha256)]
+        for sha256 in text_to_sha256.values()
+        if (model_name, sha256) in _embedding_memo
+    }
+    sha256_to_embedding.update(
+        read_embedding_caches(
+            cache_dir,
+            [
+                sha256
+                for sha256 in text_to_sha256.values()
+                if sha256 not in sha256_to_embedding
+            ],
+            model,
+        )
+    )
+
+    missing_texts = sorted(
+        (
+            text
+            for text, sha256 in text_to_sha256.items()
+            if sha256 not in sha256_to_embedding
+        ),
+        key=len,
+    )
+    logger.info(
+        f"{desc}: {len(text_to_sha256)} unique texts of {len(texts)}, "
+        f"{len(text_to_sha256) - len(missing_texts)} cached, {len(missing_texts)} to encode."
+    )
+
+    chunks = range(0, len(missing_texts), embedding_chunk_size)
+    for start in tqdm(chunks, desc=desc, unit="chunk", disable=not missing_texts):
+        chunk = missing_texts[start : start + embedding_chunk_size]
+        chunk_embeddings = inference_executor.encode(
+            model, chunk, batch_size=embedding_batch_size, show_progress_bar=False
+        )
+        for text, embedding in zip(chunk, chunk_embeddings):
+            sha256 = text_to_sha256[text]
+            write_embedding_cache(cache_dir, sha256, embedding, model)
+            sha256_to_embedding[sha256] = embedding
+
+    if memoize:
+        for sha256, embedding in sha256_to_embedding.items():
+            _embedding_memo[(model_name, sha256)] = embedding
+
+    return [sha256_to_embedding[text_to_sha256[text]] for text in texts]
+
+
+class CourseEmbeddingRegistry:
+    """
+    The embedding of every course, computed once per course and model from its short
+    summary, and shared by the aggregate and optimize steps.
+
+    Embeddings are rows of `matrix`, aligned with `course_refs` (sorted by
+    identifier). The registry is persisted per model, with a hash of each course's
+    summary, so only courses whose summaries changed are embedded again.
+    """
+
+    def __init__(self, course_refs, hashes, matrix):
+        self.course_refs = list(course_refs)
+        self.hashes = list(hashes)
+        self.matrix = np.asarray(matrix)
+        self.course_ref_to_row = {ref: i for i, ref in enumerate(self.course_refs)}
+
+    @classmethod
+    def build(
+        cls, cache_dir, model: SentenceTransformer, course_ref_to_course
+    ) -> "CourseEmbeddingRegistry":
+        course_refs = sorted(course_ref_to_course, key=lambda c: c.get_identifier())
+        summaries = [
+            course_ref_to_course[ref].get_short_summary() for ref in course_refs
+        ]
+        hashes = [hashlib.sha256(summary.encode()).hexdigest() for summary in summaries]
+
+        previous = read_course_embeddings_cache(cache_dir, model)
+        previous_rows = {}
+        if previous is not None:
+            previous_rows = {
+                (identifier, sha256): row
+                for row, (identifier, sha256) in enumerate(
+                    zip(previous["identifiers"].tolist(), previous["hashes"].tolist())
+                )
+            }
+        rows = [
+            previous_rows.get((ref.get_identifier(), sha256))
+            for ref, sha256 in zip(course_refs, hashes)
+        ]
+
+        missing = [i for i, row in enumerate(rows) if row is None]
+        missing_embeddings = get_embeddings(
+            cache_dir,
+            model,
+            [summaries[i] for i in missing],
+            "Course Embeddings",
+            memoize=False,
+        )
+        missing_to_embedding = dict(zip(missing, missing_embeddings))
+        matrix = np.array(
+            [
+                missing_to_embedding[i] if row is None else previous["embeddings"][row]
+                for i, row in enumerate(rows)
+            ],
+            dtype=np.float32,
+        )
+        logger.info(
+            f"Course embeddings: {len(course_refs) - len(missing)} reused, {len(missing)} embedded."
+        )
+
+        registry = cls(course_refs, hashes, matrix)
+        if missing or previous is None or len(previous["hashes"]) != len(hashes):
+            write_course_embeddings_cache(cache_dir, model, registry.to_arrays())
+        return registry
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {
+            "identifiers": np.array([ref.get_identifier() for ref in self.course_refs]),
+            "hashes": np.array(self.hashes),
+            "embeddings": self.matrix,
+        }
+
+    def __contains__(self, course_ref):
+        return course_ref in self.course_ref_to_row
+
+    def __getitem__(self, course_ref) -> np.ndarray:
+        return self.matrix[self.course_ref_to_row[course_ref]]
+
+
+# Registries built during this run, by model cache name
+_course_embedding_registries: dict[str, CourseEmbeddingRegistry] = {}
+
+
+def get_course_embedding_registry(
+    cache_dir, model: SentenceTransformer, course_ref_to_course
+) -> CourseEmbeddingRegistry:
+    registry = CourseEmbeddingRegistry.build(cache_dir, model, course_ref_to_course)
+    _course_embedding_registries[get_model_name_for_cache(model)] = registry
+    return registry
+
+
+def get_course_embedding(cache_dir, model: SentenceTransformer, course: Course):
+    """
+    Returns the embedding of a course from the model's registry, or embeds its short
+    summary if the registry does not have it.
+    """
+    registry = _course_embedding_registries.get(get_model_name_for_cache(model))
+    if registry is not None and course.course_reference in registry:
+        return registry[course.course_reference]
+    return get_embedding(cache_dir, model, course.get_short_summary())
+
+
 def normalize(v):
     return v / np.linalg.norm(v)
 
 
+# Memory ceiling of the arrays allocated for each block of similarities computed by
+# `top_k_similar` and `update_top_k_similar`
+similarity_block_bytes = 64 * 1024 * 1024
+
+
+def top_k_similar(
+    embeddings, k, allowed_mask=None, query_indices=None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k cosine similarity search, computed over blocks of query rows so that
+    memory stays under `similarity_block_bytes` instead of growing with N×N.
+
+    Embeddings are normalized here, so they don't need to be unit length.
+
+    Args:
+        embeddings: Matrix with one embedding per row
+        k: Number of most similar rows to find for each query
+        allowed_mask: Optional booleans over rows; rows that are not allowed are only
+            returned if fewer than k rows are, with a similarity of -inf
+        query_indices: Rows to find the most similar rows of (defaults to every row);
+            a row is never returned as similar to itself
+
+    Returns:
+        Tuple of (indices, similarities) matrices, one row per query, most similar
+        first, with ties broken by index
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.maximum(norms, np.finfo(np.float32).tiny)
+
+    total = len(embeddings)
+    if query_indices is None:
+        query_indices = np.arange(total)
+    query_indices = np.asarray(query_indices, dtype=np.intp)
+    k = min(k, total)
+
+    top_indices = np.empty((len(query_indices), k), dtype=np.intp)
+    top_similarities = np.empty((len(query_indices), k), dtype=np.float32)
+    # Each entry of a block takes a float32 similarity and an intp from argpartition
+    block_rows = max(1, similarity_block_bytes // (12 * max(total, 1)))
+
+    for start in range(0, len(query_indices), block_rows):
+        block = query_indices[start : start + block_rows]
+        similarities = embeddings[block] @ embeddings.T
+        if allowed_mask is not None:
+            similarities[:, ~allowed_mask] = -np.inf
+        similarities[np.arange(len(block)), block] = -np.inf
+
+        candidates = np.argpartition(similarities, -k, axis=1)[:, -k:]
+        candidate_similarities = np.take_along_axis(similarities, candidates, axis=1)
+        order = np.lexsort((candidates, -candidate_similarities), axis=1)
+
+        top_indices[start : start + len(block)] = np.take_along_axis(
+            candidates, order, axis=1
+        )
+        top_similarities[start : start + len(block)] = np.take_along_axis(
+            candidate_similarities, order, axis=1
+        )
+
+    return top_indices, top_similarities
+
+
+def update_top_k_similar(
+    embeddings, k, keys, hashes, allowed_mask=None, previous=None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Incremental version of `top_k_similar` over every row, reusing the results of a
+    previous run for rows whose embeddings did not change.
+
+    An unchanged row keeps its previous neighbors unless one of them changed or was
+    removed, so its top k are the best of its previous top k and the changed rows.
+    Every other row is searched in full, so the results match `top_k_similar`.
+
+    Args:
+        keys: Stable key of each row, such as its course identifier
+        hashes: Hash of what each row's embedding was computed from
+        previous: Dictionary of the previous run's "keys", "hashes", "neighbors"
+            (keys of each row's top k) and "similarities", or None
+
+    Returns:
+        Tuple of (indices, similarities) matrices, like `top_k_similar`
+    """
+    total = len(keys)
+    k = min(k, total)
+    if previous is None or previous["neighbors"].shape[1:] != (k,):
+        return top_k_similar(embeddings, k, allowed_mask=allowed_mask)
+
+    key_to_index = {key: i for i, key in enumerate(keys)}
+    key_to_hash = dict(zip(keys, hashes))
+    previous_keys = previous["keys"].tolist()
+    previous_rows = {key: row for row, key in enumerate(previous_keys)}
+    stale_keys = {
+        key
+        for key, previous_hash in zip(previous_keys, previous["hashes"].tolist())
+        if key_to_hash.get(key) != previous_hash
+    }
+
+    changed = np.array(
+        [key not in previous_rows or key in stale_keys for key in keys], dtype=bool
+    )
+    clean = np.array(
+        [
+            not changed[i]
+            and not stale_keys.intersection(
+                previous["neighbors"][previous_rows[key]].tolist()
+            )
+            for i, key in enumerate(keys)
+        ],
+        dtype=bool,
+    )
+    if changed.sum() > total // 2:
+        return top_k_similar(embeddings, k, allowed_mask=allowed_mask)
+
+    top_indices = np.empty((total, k), dtype=np.intp)
+    top_similarities = np.empty((total, k), dtype=np.float32)
+
+    dirty_rows = np.flatnonzero(~clean)
+    if len(dirty_rows):
+        top_indices[dirty_rows], top_similarities[dirty_rows] = top_k_similar(
+            embeddings, k, allowed_mask=allowed_mask, query_indices=dirty_rows
+        )
+
+    clean_rows = np.flatnonzero(clean)
+    changed_rows = np.flatnonzero(changed)
+    if len(clean_rows):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors = vectors / np.maximum(
+            np.linalg.norm(vectors, axis=1, keepdims=True), np.finfo(np.float32).tiny
+        )
+        previous_indices = np.array(
+            [
+                [
+                    key_to_index[key]
+                    for key in previous["neighbors"][previous_rows[keys[i]]]
+                ]
+                for i in clean_rows
+            ],
+            dtype=np.intp,
+        ).reshape(len(clean_rows), k)
+        previous_similarities = np.array(
+            [previous["similarities"][previous_rows[keys[i]]] for i in clean_rows],
+            dtype=np.float32,
+        ).reshape(len(clean_rows), k)
+
+        # Each changed column of a block takes a float32 similarity, plus a concatenated
+        # float32 similarity, intp candidate and intp lexsort position
+        block_rows = max(1, similarity_block_bytes // (24 * max(len(changed_rows), 1)))
+        for start in range(0, len(clean_rows), block_rows):
+            block = slice(start, start + block_rows)
+            rows = clean_rows[block]
+            changed_similarities = vectors[rows] @ vectors[changed_rows].T
+            if allowed_mask is not None:
+                changed_similarities[:, ~allowed_mask[changed_rows]] = -np.inf
+
+            candidates = np.concatenate(
+                [
+                    previous_indices[block],
+                    np.broadcast_to(changed_rows, changed_similarities.shape),
+                ],
+                axis=1,
+            )
+            candidate_similarities = np.concatenate(
+                [previous_similarities[block], changed_similarities], axis=1
+            )
+            order = np.lexsort((candidates, -candidate_similarities), axis=1)[:, :k]
+            top_indices[rows] = np.take_along_axis(candidates, order, axis=1)
+            top_similarities[rows] = np.take_along_axis(
+                candidate_similarities, order, axis=1
+            )
+
+    logger.info(
+        f"Similar rows updated incrementally: {changed.sum()} changed, "
+        f"{len(dirty_rows)} searched, {len(clean_rows)} merged."
+    )
+    return top_indices, top_similarities
+
+
 def cosine_similarity(vec_a, vec_b):
     """
     Computes the cosine similarity between two vectors.
@@ -204,9 +748,9 @@ def find_best_prerequisite(
     and_count = len(re.findall(r"\d*and\d*", prerequisite_text))
     max_prerequisites += and_count
 
-    course_embedding = get_embedding(cache_dir, model, course.get_full_summary())
+    course_embedding = get_course_embedding(cache_dir, model, course)
     prerequisite_embeddings = [
-        (prereq, get_embedding(cache_dir, model, prereq.get_short_summary()))
+        (prereq, get_course_embedding(cache_dir, model, prereq))
         for prereq in prerequisites
     ]
 
@@ -237,7 +781,7 @@ def score_branch(
     if not branch:
         return 0
 
-    course_embedding = get_embedding(cache_dir, model, course.get_full_summary())
+    course_embedding = get_course_embedding(cache_dir, model, course)
     branch_as_courses = [
         course_ref_to_course[cr]
         for cr in branch
@@ -247,19 +791,37 @@ def score_branch(
     if not branch_as_courses:
         return 0
     branch_embeddings = [
-        get_embedding(cache_dir, model, course.get_full_summary())
-        for course in branch_as_courses
+        get_course_embedding(cache_dir, model, course) for course in branch_as_courses
     ]
-    branch_embedding = average_embedding(branch_embeddings)
 
-    # Calculate the cosine similarity between the course and the branch
-    similarity = cosine_similarity(course_embedding, branch_embedding)
+    return branch_score_from_embeddings(
+        course_embedding,
+        branch_embeddings,
+        get_enrollment_score(course, max_enrollment),
+        semantic_similarity_weight,
+        popularity_weight,
+    )
 
+
+def get_enrollment_score(course: Course, max_enrollment):
     enrollment_count = 0
     if course.cumulative_grade_data:
         enrollment_count = course.cumulative_grade_data.total
 
-    enrollment_score = enrollment_count / max_enrollment
+    return enrollment_count / max_enrollment
+
+
+def branch_score_from_embeddings(
+    course_embedding,
+    branch_embeddings,
+    enrollment_score,
+    semantic_similarity_weight,
+    popularity_weight,
+):
+    branch_embedding = average_embedding(branch_embeddings)
+
+    # Calculate the cosine similarity between the course and the branch
+    similarity = cosine_similarity(course_embedding, branch_embedding)
 
     score = (
         semantic_similarity_weight * similarity + popularity_weight * enrollment_score
@@ -267,6 +829,228 @@ def score_branch(
     return score
 
 
+def find_best_branches(
+    cache_dir,
+    model,
+    course: Course,
+    course_ref_to_course,
+    max_enrollment,
+    semantic_similarity_weight,
+    popularity_weight,
+    top_k=1,
+    max_expansions=100_000,
+) -> list[tuple[float, list[Course.Reference]]]:
+    """
+    Finds the top-k prerequisite branches of a course with a branch-and-bound search
+    over its requisite tree, scoring branches like `score_branch`.
+
+    The popularity term only depends on the course, so branches are ranked by the
+    cosine similarity between the course and their average embedding. Partial
+    branches are pruned with an upper bound on that similarity. Embeddings are
+    expressed in coordinates along the course embedding and an orthonormal basis
+    orthogonal to it, and every subtree is bounded by the interval of coordinate sums
+    it can reach. The similarity is then at most the highest reachable projection
+    over its hypotenuse with the smallest reachable orthogonal norm.
+
+    Args:
+        top_k: Number of branches to keep
+        max_expansions: Partial branches to expand before returning the best found so
+            far, bounding the time spent on pathological requisite trees
+
+    Returns:
+        List of (score, branch) tuples, best first; ties keep the tree's branch order
+    """
+    tree = course.prerequisites.abstract_syntax_tree
+    course_embedding = get_course_embedding(cache_dir, model, course)
+    course_direction = normalize(course_embedding)
+    enrollment_score = get_enrollment_score(course, max_enrollment)
+
+    # Embeddings of every course in the tree that counts towards a branch's score
+    ref_to_embedding = {}
+    nodes = [tree.root]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, Leaf):
+            reference = node.payload
+            if (
+                not isinstance(reference, str)
+                and reference not in ref_to_embedding
+                and reference in course_ref_to_course
+                and reference != course.course_reference
+            ):
+                ref_to_embedding[reference] = get_course_embedding(
+                    cache_dir, model, course_ref_to_course[reference]
+                )
+        else:
+            nodes.extend(node.children)
+
+    # Coordinates of each embedding along the course direction, then along an
+    # orthonormal basis of the embeddings' components orthogonal to it
+    ref_to_coordinates = {}
+    if ref_to_embedding:
+        embeddings = np.array(list(ref_to_embedding.values()), dtype=np.float64)
+        projections = embeddings @ course_direction
+        orthogonals = embeddings - np.outer(projections, course_direction)
+        _, singular_values, basis = np.linalg.svd(orthogonals, full_matrices=False)
+        basis = basis[singular_values > singular_values[0] * 1e-9]
+        coordinates = np.column_stack([projections, orthogonals @ basis.T])
+        ref_to_coordinates = dict(zip(ref_to_embedding, coordinates))
+    zeros = np.zeros(
+        len(next(iter(ref_to_coordinates.values()))) if ref_to_coordinates else 1
+    )
+
+    node_bounds = {}
+
+    def bounds(node):
+        """Returns the (lowest, highest) coordinates reachable from a node."""
+        if id(node) in node_bounds:
+            return node_bounds[id(node)]
+
+        if isinstance(node, Leaf):
+            coordinates = ref_to_coordinates.get(node.payload, zeros)
+            result = (coordinates, coordinates)
+        else:
+            child_bounds = [bounds(child) for child in node.children]
+            lows = np.array([low for low, _ in child_bounds])
+            highs = np.array([high for _, high in child_bounds])
+            if node.operator == "AND":
+                result = (lows.sum(axis=0), highs.sum(axis=0))
+            else:
+                result = (lows.min(axis=0), highs.max(axis=0))
+
+        node_bounds[id(node)] = result
+        return result
+
+    # Sibling branches share their chosen courses and their pending nodes after the
+    # branching node, so their coordinate sums are memoized
+    chosen_sums = {}
+    rest_bounds = {}
+
+    def chosen_sum(chosen):
+        total = chosen_sums.get(chosen)
+        if total is None:
+            total = zeros.copy()
+            for reference in chosen:
+                total += ref_to_coordinates.get(reference, zeros)
+            if len(chosen_sums) > 10_000:
+                chosen_sums.clear()
+            chosen_sums[chosen] = total
+        return total
+
+    def pending_bounds(pending):
+        if not pending:
+            return zeros, zeros
+        rest = pending[1:]
+        rest_bound = rest_bounds.get(rest)
+        if rest_bound is None:
+            rest_low, rest_high = zeros.copy(), zeros.copy()
+            for node in rest:
+                node_low, node_high = bounds(node)
+                rest_low += node_low
+                rest_high += node_high
+            rest_bound = (rest_low, rest_high)
+            if len(rest_bounds) > 10_000:
+                rest_bounds.clear()
+            rest_bounds[rest] = rest_bound
+        node_low, node_high = bounds(pending[0])
+        return rest_bound[0] + node_low, rest_bound[1] + node_high
+
+    def upper_bound(chosen, pending) -> float:
+        total = chosen_sum(chosen)
+        pending_low, pending_high = pending_bounds(pending)
+        low = total + pending_low
+        high = total + pending_high
+
+        max_projection = high[0]
+        # Distance of each orthogonal coordinate's reachable interval from 0
+        min_orthogonal = np.maximum(np.maximum(low[1:], -high[1:]), 0.0)
+        min_orthogonal_norm = np.linalg.norm(min_orthogonal)
+
+        if max_projection <= 0:
+            similarity_bound = 0.0
+        else:
+            similarity_bound = max_projection / np.hypot(
+                max_projection, min_orthogonal_norm
+            )
+
+        # Branches without any scored course score 0
+        score_bound = (
+            semantic_similarity_weight * similarity_bound
+            + popularity_weight * enrollment_score
+        )
+        return max(0.0, score_bound) + 1e-6
+
+    def score(branch) -> float:
+        branch_embeddings = [
+            ref_to_embedding[reference]
+            for reference in branch
+            if reference in ref_to_embedding
+        ]
+        if not branch_embeddings:
+            return 0
+        return branch_score_from_embeddings(
+            course_embedding,
+            branch_embeddings,
+            enrollment_score,
+            semantic_similarity_weight,
+            popularity_weight,
+        )
+
+    def greedy_branch(node) -> list[Course.Reference]:
+        if isinstance(node, Leaf):
+            return [] if isinstance(node.payload, str) else [node.payload]
+        if node.operator == "AND":
+            return [
+                reference
+                for child in node.children
+                for reference in greedy_branch(child)
+            ]
+        best_child = max(node.children, key=lambda child: upper_bound((), (child,)))
+        return greedy_branch(best_child)
+
+    # A greedy branch's score is a lower bound on the best score, so anything
+    # scoring strictly less can be pruned before the search finds a good branch
+    seed_branch = greedy_branch(tree.root) if top_k == 1 else []
+    seed_score = score(seed_branch) if seed_branch else -np.inf
+
+    # Min-heap of (score, -order, branch). The seed is kept in case the expansion limit
+    # stops the search before it finds anything better, but sorts after every branch
+    # found by the search, so any found branch scoring at least as well replaces it.
+    top_branches = [(seed_score, -np.inf, seed_branch)] if seed_branch else []
+    expansions = 0
+
+    def prune(chosen, pending) -> bool:
+        nonlocal expansions
+        expansions += 1
+        if expansions > max_expansions:
+            return True
+        if len(top_branches) < top_k:
+            return False
+        bound = upper_bound(chosen, pending)
+        worst_score, worst_order, _ = top_branches[0]
+        # Branches tying the seed may still replace it
+        if worst_order == -np.inf:
+            return bound < worst_score
+        return bound <= worst_score
+
+    for order, branch in enumerate(tree.iter_course_combinations(prune=prune)):
+        branch_score = score(branch)
+        if len(top_branches) < top_k:
+            heapq.heappush(top_branches, (branch_score, -order, branch))
+        elif (branch_score, -order) > top_branches[0][:2]:
+            heapq.heapreplace(top_branches, (branch_score, -order, branch))
+
+    if expansions > max_expansions:
+        logger.warning(
+            f"Branch search for {course.get_identifier()} stopped after {max_expansions} expansions."
+        )
+
+    return [
+        (score, branch)
+        for score, _, branch in sorted(top_branches, key=lambda x: (-x[0], -x[1]))
+    ]
+
+
 def prune_prerequisites(
     cache_dir,
     model,
@@ -282,25 +1066,18 @@ def prune_prerequisites(
         course.optimized_prerequisites = course.prerequisites.course_references
         return
 
-    branches = course.prerequisites.abstract_syntax_tree.course_combinations()
-    semantic_similarity_weight = 0.5
-    popularity_weight = 0.5
-    best_score = -1
+    best_branches = find_best_branches(
+        cache_dir=cache_dir,
+        model=model,
+        course=course,
+        course_ref_to_course=course_ref_to_course,
+        max_enrollment=max_enrollment,
+        semantic_similarity_weight=0.5,
+        popularity_weight=0.5,
+    )
     best_branch = None
-    for branch in branches:
-        score = score_branch(
-            cache_dir=cache_dir,
-            model=model,
-            course=course,
-            course_ref_to_course=course_ref_to_course,
-            max_enrollment=max_enrollment,
-            branch=branch,
-            semantic_similarity_weight=semantic_similarity_weight,
-            popularity_weight=popularity_weight,
-        )
-        if score > best_score:
-            best_score = score
-            best_branch = branch
+    if best_branches and best_branches[0][0] > -1:
+        best_branch = best_branches[0][1]
 
     course.optimized_prerequisites = best_branch
 
@@ -359,12 +1136,18 @@ def optimize_prerequisite(
                 return
 
 
+# Threads searching prerequisite branches; the search is mostly pure Python, so more
+# threads would only contend for the GIL
+optimize_workers = 4
+
+
 async def optimize_prerequisites(
     cache_dir: str,
     model: SentenceTransformer,
     course_ref_to_course: dict[Course.Reference, Course],
     max_prerequisites: int | float,
     max_retries: int,
+    workers: int = optimize_workers,
 ):
     total_courses = len(course_ref_to_course)
     logger.info(f"Optimizing prerequisites for {total_courses} courses...")
@@ -375,19 +1158,68 @@ async def optimize_prerequisites(
         if c.cumulative_grade_data
     )
 
-    # Create tasks for each course and wait for them all to complete.
-    tasks = [
-        asyncio.to_thread(
-            optimize_prerequisite,
-            cache_dir,
-            course,
-            model,
-            course_ref_to_course,
-            max_enrollment,
-            max_prerequisites,
-            max_retries,
-        )
-        for course in course_ref_to_course.values()
-    ]
-    await tqdm.gather(*tasks, desc="Optimizing Prerequisites", unit="course")
+    # Embed every course once up front, so the branch searches below only read rows
+    # of the registry
+    await asyncio.to_thread(
+        get_course_embedding_registry, cache_dir, model, course_ref_to_course
+    )
+
+    # Every course is optimized on a bounded pool of threads, rather than a thread each
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="optimize"
+    ) as executor:
+        tasks = [
+            loop.run_in_executor(
+                executor,
+                optimize_prerequisite,
+                cache_dir,
+                course,
+                model,
+                course_ref_to_course,
+                max_enrollment,
+                max_prerequisites,
+                max_retries,
+            )
+            for course in course_ref_to_course.values()
+        ]
+        await tqdm.gather(*tasks, desc="Optimizing Prerequisites", unit="course")
     logger.info("Optimization completed.")
+
+    await asyncio.to_thread(check_optimized_prerequisites, course_ref_to_course)
+
+
+def check_optimized_prerequisites(course_ref_to_course: dict[Course.Reference, Course]):
+    """
+    Warns about courses whose optimized prerequisites do not satisfy their requisites,
+    such as those chosen by `find_best_prerequisite` when no branch was found.
+    """
+    # Courses keeping all of their referenced prerequisites satisfy them trivially
+    course_ref_to_optimized = {
+        course_ref: course.optimized_prerequisites or []
+        for course_ref, course in course_ref_to_course.items()
+        if course.prerequisites
+        and course.prerequisites.abstract_syntax_tree
+        and set(course.optimized_prerequisites or [])
+        != set(course.prerequisites.course_references)
+    }
+    if not course_ref_to_optimized:
+        return
+
+    evaluator = PrerequisiteEvaluator(course_ref_to_course)
+    satisfied = evaluator.satisfied_by(course_ref_to_optimized)
+
+    unsatisfied = sorted(
+        course_ref.get_identifier()
+        for course_ref, is_satisfied in satisfied.items()
+        if not is_satisfied
+    )
+    for identifier in unsatisfied:
+        logger.debug(
+            f"Optimized prerequisites of {identifier} do not satisfy its requisites"
+        )
+    if unsatisfied:
+        logger.warning(
+            f"Optimized prerequisites of {len(unsatisfied)} out of {len(satisfied)} "
+            f"courses do not satisfy their requisites."
+        )
@@ -1,16 +1,17 @@
 import asyncio
+from collections import deque
 from datetime import datetime, timedelta, timezone
-from json import JSONDecodeError
 from logging import getLogger
 from zoneinfo import ZoneInfo
 
+import aiohttp
 import requests
-from aiohttp_client_cache import CachedSession
 from tqdm.asyncio import tqdm
 
-from aio_cache import get_aio_cache
+from aio_cache import CoalescingCachedSession, get_aio_cache
 from course import Course
 from enrollment_data import EnrollmentData, TermData
+from retry_policy import raise_for_retryable_status, retry_policy
 
 terms_url = "https://public.enroll.wisc.edu/api/search/v1/aggregate"
 query_url = "https://public.enroll.wisc.edu/api/search/v1"
@@ -18,6 +19,10 @@ enrollment_package_base_url = (
     "https://public.enroll.wisc.edu/api/search/v1/enrollmentPackages"
 )
 
+mega_query_page_size = 500
+enrollment_package_workers = 50
+enrollment_package_queue_size = 2 * mega_query_page_size
+
 logger = getLogger(__name__)
 
 # Module-level constants to avoid repeated instantiation
@@ -65,74 +70,191 @@ def sync_enrollment_terms(terms):
     return term_times
 
 
-async def build_from_mega_query(
-    selected_term: str, term_name, terms, course_ref_to_course
+async def iterate_mega_query_hits(
+    session, selected_term: str, term_name, page_size=mega_query_page_size
 ):
+    """
+    Pages through the enrollment search for a term, yielding hits as each page arrives.
+
+    Only a single page of hits is held at a time, instead of the full "mega query"
+    response for the term.
+
+    Args:
+        session: HTTP session used for the search requests
+        selected_term: Term code to search
+        term_name: Human-readable term name, used for logging
+        page_size: Number of hits requested per page
+
+    Yields:
+        Tuples of (index, course_count, hit)
+    """
     post_data = {
         "selectedTerm": selected_term,
         "queryString": "",
         "filters": [],
         "page": 1,
-        "pageSize": 1,
+        "pageSize": page_size,
     }
 
-    async with CachedSession(cache=get_aio_cache()) as session:
-        logger.debug(f"Building enrollment package for {term_name}...")
+    index = 0
+
+    async def fetch_search_page():
         async with session.post(url=query_url, json=post_data) as response:
-            data = await response.json()
-        course_count = data["found"]
+            raise_for_retryable_status(response)
+            return await response.json()
+
+    while True:
+        data = await retry_policy.call(fetch_search_page, query_url)
 
-        if not course_count:
-            logger.warning(f"No courses found in the {term_name} term")
-            return {}
+        course_count = data["found"]
+        hits = data["hits"]
+        if not hits:
+            break
 
-        post_data["pageSize"] = course_count
         logger.debug(
-            f"Discovered {course_count} courses in the {term_name} term. Syncing terms..."
+            f"Received page {post_data['page']} with {len(hits)} of {course_count} courses in the {term_name} term"
         )
-        async with session.post(url=query_url, json=post_data) as response:
-            data = await response.json()
+        for hit in hits:
+            yield index, course_count, hit
+            index += 1
 
-        hits = data["hits"]
-        all_instructors = {}
-        all_meetings = {}
-
-        # Create tasks for each hit to concurrently fetch enrollment package data.
-        tasks = [
-            process_hit(
-                hit,
-                i,
-                course_count,
-                selected_term,
-                term_name,
-                terms,
-                course_ref_to_course,
-                session,
-            )
-            for i, hit in enumerate(hits)
-        ]
-        results = await tqdm.gather(
-            *tasks, desc=f"Courses in {term_name}", unit="course"
-        )
-        for result in results:
-            if result is None:
-                continue
-            instructors, meetings, course_ref = result
-            for full_name, email in instructors.items():
-                all_instructors.setdefault(full_name, email)
-
-            # Group meetings by course identifier using the course_reference
-            if meetings:
-                course_identifier = course_ref
-                all_meetings.setdefault(course_identifier, set()).update(meetings)
+        if index >= course_count:
+            break
+        post_data["page"] += 1
+
+
+def merge_hit_result(result, all_instructors, all_meetings):
+    """
+    Merges the instructors and meetings of one course hit into its term's results.
+
+    Hits must be merged in the mega query's hit order: when an instructor name appears
+    with different emails, the email of the first hit wins within a term, matching the
+    baseline. Across terms, `gather_instructor_emails` lets later terms override earlier
+    ones.
+    """
+    if result is None:
+        return
+    instructors, meetings, course_ref = result
+    for full_name, email in instructors.items():
+        all_instructors.setdefault(full_name, email)
+
+    # Group meetings by course identifier using the course_reference
+    if meetings:
+        course_identifier = course_ref
+        all_meetings.setdefault(course_identifier, set()).update(meetings)
+
+
+async def sync_enrollment_packages(
+    terms,
+    course_ref_to_course,
+    workers=enrollment_package_workers,
+    queue_size=enrollment_package_queue_size,
+    concurrent_terms=2,
+):
+    """
+    Fetches the enrollment package of every course hit across all terms.
+
+    Hits from every term feed a single bounded priority queue, drained by a fixed pool
+    of workers sharing one connection pool. Newer terms are prioritized, and at most
+    `concurrent_terms` terms are paged through at once, so memory and request
+    concurrency stay constant regardless of how many terms are synced.
+
+    Args:
+        terms: Mapping of term codes to term names
+        course_ref_to_course: Mapping of course references to courses
+        workers: Number of concurrent enrollment package fetches
+        queue_size: Maximum number of hits waiting to be fetched
+        concurrent_terms: Number of terms paged through concurrently
 
+    Returns:
+        Mapping of term codes to (instructors, meetings) for terms with courses
+    """
+    sorted_terms = deque(sorted(terms.keys(), reverse=True))
+    # Results of each term by hit index, merged in hit order once every hit is done
+    term_hit_results = {term: {} for term in sorted_terms}
+    term_progress = {}
+    queue = asyncio.PriorityQueue(maxsize=queue_size)
+
+    async def produce(session):
+        while sorted_terms:
+            term = sorted_terms.popleft()
+            term_name = terms[term]
+            logger.debug(f"Building enrollment package for {term_name}...")
+            async for i, course_count, hit in iterate_mega_query_hits(
+                session, str(term), term_name
+            ):
+                if term not in term_progress:
+                    term_progress[term] = tqdm(
+                        total=course_count,
+                        desc=f"Courses in {term_name}",
+                        unit="course",
+                        leave=False,
+                    )
+                # Index breaks ties within a term, so hits themselves are never compared.
+                await queue.put((-term, i, course_count, hit))
+
+            if term not in term_progress:
+                logger.warning(f"No courses found in the {term_name} term")
+
+    async def consume(session):
+        while True:
+            priority, i, course_count, hit = await queue.get()
+            term = -priority
+            try:
+                result = await process_hit(
+                    hit,
+                    i,
+                    course_count,
+                    str(term),
+                    terms[term],
+                    terms,
+                    course_ref_to_course,
+                    session,
+                )
+                term_hit_results[term][i] = result
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                logger.error(f"Failed to process course hit in {terms[term]}: {e}")
+            finally:
+                term_progress[term].update()
+                queue.task_done()
+
+    connector = aiohttp.TCPConnector(limit=workers, limit_per_host=workers)
+    async with CoalescingCachedSession(
+        cache=get_aio_cache(), connector=connector
+    ) as session:
+
+        async def drain():
+            await asyncio.gather(*[produce(session) for _ in range(concurrent_terms)])
+            await queue.join()
+
+        consumers = [asyncio.create_task(consume(session)) for _ in range(workers)]
+        tasks = [asyncio.create_task(drain()), *consumers]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            # Consumers only finish by raising, so an unexpected error is re-raised
+            # instead of leaving the queue without workers to drain it
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    term_results = {}
+    for term, progress in term_progress.items():
+        progress.close()
+        all_instructors, all_meetings = term_results[term] = ({}, {})
+        hit_results = term_hit_results[term]
+        for i in sorted(hit_results):
+            merge_hit_result(hit_results[i], all_instructors, all_meetings)
         logger.info(
-            f"Discovered {len(all_instructors)} unique instructors teaching in {term_name}"
+            f"Discovered {len(all_instructors)} unique instructors teaching in {terms[term]}"
         )
         logger.info(
-            f"Discovered meetings for {len(all_meetings)} courses in {term_name}"
+            f"Discovered meetings for {len(all_meetings)} courses in {terms[term]}"
         )
-        return all_instructors, all_meetings
+
+    return term_results
 
 
 def extract_time_as_cst_wall_clock(epoch_ms):
@@ -274,27 +396,19 @@ async def process_hit(
         selected_term, subject_code, course_id
     )
 
-    try:
+    async def fetch_enrollment_package():
         async with session.get(url=enrollment_package_url) as response:
-            data = await response.json()
-    except (JSONDecodeError, Exception) as e:
+            raise_for_retryable_status(response)
+            return await response.json()
+
+    try:
+        data = await retry_policy.call(
+            fetch_enrollment_package, enrollment_package_url, attempts=attempts
+        )
+    except Exception as e:
         logger.warning(
             f"Failed to fetch enrollment data for {course_ref.get_identifier()}: {str(e)}"
         )
-        if attempts > 0:
-            logger.info(f"Retrying {attempts} more times...")
-            await asyncio.sleep(1)
-            return await process_hit(
-                hit,
-                i,
-                course_count,
-                selected_term,
-                term_name,
-                terms,
-                course_ref_to_course,
-                session,
-                attempts - 1,
-            )
         return None
 
     course_instructors = {}
@@ -1,9 +1,7 @@
-import asyncio
-from json import JSONDecodeError
-
 from logging import getLogger
 
 from json_serializable import JsonSerializable
+from retry_policy import raise_for_retryable_status, retry_policy
 from safe_parse import safe_int
 
 logger = getLogger(__name__)
@@ -432,30 +430,65 @@ class GradeData(JsonSerializable):
         }
 
 
-class MadgradesData:
+class MadgradesData(JsonSerializable):
     def __init__(self, cumulative, by_term: dict[str, GradeData]):
         self.cumulative = cumulative
         self.by_term = by_term
 
+    @classmethod
+    def from_json(cls, json_data) -> "MadgradesData":
+        return MadgradesData(
+            cumulative=GradeData.from_json(json_data["cumulative"]),
+            by_term={
+                term: GradeData.from_json(grade_data)
+                for term, grade_data in json_data["by_term"].items()
+            },
+        )
+
+    def to_dict(self):
+        return {
+            "cumulative": self.cumulative.to_dict(),
+            "by_term": {
+                term: grade_data.to_dict() for term, grade_data in self.by_term.items()
+            },
+        }
+
+    def merge_with(self, other: "MadgradesData") -> "MadgradesData":
+        """
+        Merges freshly fetched Madgrades data into this (cached) data.
+
+        Offerings from `other` take precedence for overlapping terms, and its
+        cumulative data replaces ours since Madgrades recomputes it over every term.
+        """
+        return MadgradesData(
+            cumulative=other.cumulative,
+            by_term={**self.by_term, **other.by_term},
+        )
+
     @classmethod
     async def from_madgrades_async(
-        cls, session, url, madgrades_api_key, current_page, attempts=3
-    ) -> "MadgradesData":
+        cls,
+        session,
+        url,
+        madgrades_api_key,
+        current_page,
+        attempts=3,
+        expire_after=None,
+    ) -> "MadgradesData | None":
         auth_header = {"Authorization": f"Token token={madgrades_api_key}"}
 
+        async def fetch_grades():
+            async with session.get(
+                url, headers=auth_header, expire_after=expire_after
+            ) as response:
+                raise_for_retryable_status(response)
+                return await response.json()
+
         try:
-            async with session.get(url, headers=auth_header) as response:
-                data = await response.json()
-        except (JSONDecodeError, Exception) as e:
-            if attempts > 0:
-                logger.debug(
-                    f"Failed to fetch Madgrades data from {url}: {e}. Attempting {attempts} more times..."
-                )
-                await asyncio.sleep(1)
-                return await cls.from_madgrades_async(
-                    session, url, madgrades_api_key, current_page, attempts - 1
-                )
+            data = await retry_policy.call(fetch_grades, url, attempts=attempts)
+        except Exception as e:
             logger.error(f"Failed to fetch Madgrades data from {url}: {e}")
+            return None
 
         cumulative = GradeData.from_madgrades(data["cumulative"])
         course_offerings = data["courseOfferings"]
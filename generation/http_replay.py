@@ -0,0 +1,315 @@
+"""
+Record/replay harness for the upstream HTTP interactions of the generation pipeline.
+
+In record mode, every request to the guide, Madgrades, enrollment, faculty and RMP
+hosts is captured into a portable fixture archive (gzipped JSON lines). In replay
+mode, those requests are served from the archive instead of the network, with
+configurable latency and error injection, so the full `main.py` pipeline can be
+benchmarked and regression-tested offline and reproducibly.
+
+Both the aiohttp sessions (through CoalescingCachedSession) and `requests` (through
+its transport adapter) are intercepted. Errors are only injected into the aiohttp
+requests, which retry through the retry policy, while the few unretried `requests`
+calls are always served as recorded. Requests to any other host, such as model
+downloads, always go to the network.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from base64 import b64decode, b64encode
+from collections import defaultdict
+from contextlib import contextmanager
+from logging import getLogger
+from urllib.parse import urlsplit
+
+from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = getLogger(__name__)
+
+replay_hosts = {
+    "guide.wisc.edu",
+    "api.madgrades.com",
+    "public.enroll.wisc.edu",
+    "www.ratemyprofessors.com",
+}
+
+_http_replay_config = {
+    "mode": None,
+    "archive": None,
+    "latency_ms": 0.0,
+    "error_rate": 0.0,
+}
+
+
+def create_interaction_key(method: str, url, body) -> str:
+    """
+    Builds the archive key of a request from its method, URL and body.
+
+    JSON bodies are serialized with sorted keys so that equal payloads match.
+    """
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body, sort_keys=True)
+    elif isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    raw_key = f"{method.upper()} {url}\n{body or ''}"
+    return hashlib.sha256(raw_key.encode()).hexdigest()
+
+
+class HttpArchive:
+    """
+    Fixture archive of recorded HTTP interactions, stored as gzipped JSON lines.
+
+    Interactions recorded more than once under the same key (e.g. retries) are
+    replayed in the order they were recorded, repeating the last one. Recorded
+    interactions are flushed in batches, each appended as its own gzip member.
+    """
+
+    def __init__(self, path: str, flush_every: int = 1000):
+        self.path = path
+        self.interactions: dict[str, list[dict]] = defaultdict(list)
+        self.replay_counts: dict[str, int] = defaultdict(int)
+        self.stats: dict[str, int] = defaultdict(int)
+        self.flush_every = flush_every
+        self._pending: list[str] = []
+        self._flushed = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as archive_file:
+            for line in archive_file:
+                interaction = json.loads(line)
+                self.interactions[interaction["key"]].append(interaction)
+        logger.info(
+            f"Loaded {sum(len(i) for i in self.interactions.values())} recorded interactions from {self.path}"
+        )
+
+    def record(self, method: str, url, body, status: int, headers, content: bytes):
+        interaction = {
+            "key": create_interaction_key(method, url, body),
+            "method": method.upper(),
+            "url": str(url),
+            "status": status,
+            "headers": dict(headers),
+            "content": b64encode(content).decode("ascii"),
+        }
+        with self._lock:
+            self._pending.append(json.dumps(interaction) + "\n")
+            self.stats["recorded"] += 1
+            if len(self._pending) >= self.flush_every:
+                self._flush()
+
+    def _flush(self):
+        mode = "at" if self._flushed else "wt"
+        with gzip.open(self.path, mode, encoding="utf-8") as archive_file:
+            archive_file.writelines(self._pending)
+        self._pending.clear()
+        self._flushed = True
+
+    def lookup(self, method: str, url, body) -> dict | None:
+        key = create_interaction_key(method, url, body)
+        with self._lock:
+            recorded = self.interactions.get(key)
+            if not recorded:
+                self.stats["missed"] += 1
+                return None
+            index = min(self.replay_counts[key], len(recorded) - 1)
+            self.replay_counts[key] += 1
+            self.stats["replayed"] += 1
+        return recorded[index]
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def close(self):
+        with self._lock:
+            if self._pending:
+                self._flush()
+        logger.info(
+            f"HTTP archive {self.path}: "
+            + ", ".join(f"{name}={count}" for name, count in sorted(self.stats.items()))
+        )
+
+
+def start_recording(path: str):
+    archive = HttpArchive(path)
+    _http_replay_config.update(mode="record", archive=archive)
+    HTTPAdapter.send = _intercepting_send
+    logger.info(f"Recording upstream HTTP interactions to {path}")
+
+
+def start_replay(path: str, latency_ms: float = 0.0, error_rate: float = 0.0):
+    archive = HttpArchive(path)
+    archive.load()
+    _http_replay_config.update(
+        mode="replay", archive=archive, latency_ms=latency_ms, error_rate=error_rate
+    )
+    HTTPAdapter.send = _intercepting_send
+    logger.info(
+        f"Replaying upstream HTTP interactions from {path} "
+        f"(latency: {latency_ms} ms, error rate: {error_rate:.2%})"
+    )
+
+
+def stop():
+    archive = _http_replay_config["archive"]
+    if archive is not None:
+        archive.close()
+    HTTPAdapter.send = _original_send
+    _http_replay_config.update(mode=None, archive=None)
+
+
+@contextmanager
+def intercepting(
+    record: str | None = None,
+    replay: str | None = None,
+    latency_ms: float = 0.0,
+    error_rate: float = 0.0,
+):
+    """Records to or replays from the given archive for the duration of the block, if any."""
+    if record:
+        start_recording(record)
+    elif replay:
+        start_replay(replay, latency_ms=latency_ms, error_rate=error_rate)
+    try:
+        yield
+    finally:
+        stop()
+
+
+def is_recording(url) -> bool:
+    return _http_replay_config["mode"] == "record" and _is_replay_host(url)
+
+
+def is_replaying(url) -> bool:
+    return _http_replay_config["mode"] == "replay" and _is_replay_host(url)
+
+
+def _is_replay_host(url) -> bool:
+    return urlsplit(str(url)).hostname in replay_hosts
+
+
+def _sample_latency() -> float:
+    """Samples an exponentially distributed latency in seconds around the configured mean."""
+    latency_ms = _http_replay_config["latency_ms"]
+    if not latency_ms:
+        return 0.0
+    return random.expovariate(1000.0 / latency_ms)
+
+
+def _should_inject_error() -> bool:
+    return random.random() < _http_replay_config["error_rate"]
+
+
+def _replayed_interaction(method: str, url, body, inject_errors: bool) -> dict:
+    """
+    Looks up the interaction to replay, substituting a 503 for injected errors and a
+    404 for requests missing from the archive.
+    """
+    archive = _http_replay_config["archive"]
+    if inject_errors and _should_inject_error():
+        archive.count("injected_errors")
+        return {"status": 503, "headers": {}, "content": ""}
+
+    interaction = archive.lookup(method, url, body)
+    if interaction is None:
+        logger.warning(f"No recorded interaction for {method.upper()} {url}")
+        return {"status": 404, "headers": {}, "content": ""}
+    return interaction
+
+
+class ReplayResponse:
+    """Stand-in for an aiohttp response, served from the archive."""
+
+    def __init__(self, method: str, url, interaction: dict):
+        self.method = method.upper()
+        self.url = url
+        self.status = interaction["status"]
+        self.headers = CaseInsensitiveDict(interaction["headers"])
+        self._body = b64decode(interaction["content"])
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self, encoding="utf-8", **kwargs) -> str:
+        return self._body.decode(encoding or "utf-8")
+
+    async def json(self, *, loads=json.loads, **kwargs):
+        return loads(self._body.decode("utf-8"))
+
+    def release(self):
+        pass
+
+    async def wait_for_close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+async def replay_aio_request(method: str, url, **kwargs) -> ReplayResponse:
+    await asyncio.sleep(_sample_latency())
+    interaction = _replayed_interaction(
+        method, url, kwargs.get("json") or kwargs.get("data"), inject_errors=True
+    )
+    return ReplayResponse(method, url, interaction)
+
+
+async def record_aio_response(method: str, url, kwargs, response):
+    content = await response.read()
+    _http_replay_config["archive"].record(
+        method,
+        url,
+        kwargs.get("json") or kwargs.get("data"),
+        response.status,
+        response.headers,
+        content,
+    )
+
+
+_original_send = HTTPAdapter.send
+
+
+def _intercepting_send(self, request, **kwargs):
+    if is_replaying(request.url):
+        time.sleep(_sample_latency())
+        # The sync requests (terms, RMP key, faculty directory, sitemap) are not
+        # retried, so injected errors would only abort the run
+        interaction = _replayed_interaction(
+            request.method, request.url, request.body, inject_errors=False
+        )
+
+        response = Response()
+        response.status_code = interaction["status"]
+        response.headers = CaseInsensitiveDict(interaction["headers"])
+        response._content = b64decode(interaction["content"])
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        return response
+
+    response = _original_send(self, request, **kwargs)
+    if is_recording(request.url):
+        _http_replay_config["archive"].record(
+            request.method,
+            request.url,
+            request.body,
+            response.status_code,
+            response.headers,
+            response.content,
+        )
+    return response
@@ -0,0 +1,110 @@
+"""
+Shared executor for model inference.
+
+Every `encode` call on an embedding or keyword model goes through
+`inference_executor.encode`, which runs it on a small, fixed pool of worker threads
+(one by default). Torch's intra-op and inter-op thread pools are sized explicitly, so
+that batches are parallelized inside torch instead of hundreds of Python threads
+competing with torch's own threads for the same cores. Per-model throughput metrics
+are logged at the end of each step.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+
+import torch
+
+from cache import get_model_name_for_cache
+
+logger = getLogger(__name__)
+
+
+class InferenceExecutor:
+    """
+    Serializes model inference through `workers` threads, with explicit torch thread
+    counts.
+
+    Args:
+        intra_op_threads: Threads torch uses within operations, split evenly between
+            the workers so that concurrent calls don't oversubscribe the CPUs
+            (defaults to the number of CPUs)
+        inter_op_threads: Threads torch uses to run independent operations
+        workers: Threads running inference calls concurrently
+    """
+
+    def __init__(self, intra_op_threads=None, inter_op_threads=1, workers=1):
+        self.intra_op_threads = intra_op_threads or os.cpu_count() or 1
+        self.inter_op_threads = inter_op_threads
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.metrics: dict[str, dict[str, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+
+    def configure(self, intra_op_threads=None, inter_op_threads=None, workers=None):
+        self.intra_op_threads = intra_op_threads or self.intra_op_threads
+        self.inter_op_threads = inter_op_threads or self.inter_op_threads
+        self.workers = workers or self.workers
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Torch's thread count is process-wide and used by every worker's calls
+                torch.set_num_threads(max(1, self.intra_op_threads // self.workers))
+                try:
+                    torch.set_num_interop_threads(self.inter_op_threads)
+                except RuntimeError as e:
+                    # Only possible before torch runs any parallel work
+                    logger.warning(f"Could not set torch inter-op threads: {e}")
+                logger.info(
+                    f"Running inference on {self.workers} worker(s) with "
+                    f"{torch.get_num_threads()} intra-op threads each and "
+                    f"{torch.get_num_interop_threads()} inter-op torch threads."
+                )
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="inference"
+                )
+            return self._executor
+
+    def encode(self, model, sentences, **kwargs):
+        """
+        Runs `model.encode(sentences, **kwargs)` on the inference workers, blocking
+        until it completes.
+        """
+        time_submitted = time.perf_counter()
+
+        def run():
+            time_started = time.perf_counter()
+            result = model.encode(sentences, **kwargs)
+            return result, time_started, time.perf_counter()
+
+        result, time_started, time_finished = self._get_executor().submit(run).result()
+
+        with self._metrics_lock:
+            metrics = self.metrics[get_model_name_for_cache(model)]
+            metrics["calls"] += 1
+            metrics["texts"] += 1 if isinstance(sentences, str) else len(sentences)
+            metrics["busy_seconds"] += time_finished - time_started
+            metrics["wait_seconds"] += time_started - time_submitted
+        return result
+
+    def log_metrics(self, reset=True):
+        for model_name, metrics in sorted(self.metrics.items()):
+            busy_seconds = metrics["busy_seconds"]
+            logger.info(
+                f"Inference with {model_name}: {int(metrics['calls'])} calls, "
+                f"{int(metrics['texts'])} texts, "
+                f"{metrics['texts'] / busy_seconds if busy_seconds else 0:.1f} texts/s, "
+                f"{busy_seconds:.2f} s busy, {metrics['wait_seconds']:.2f} s queued"
+            )
+        if reset:
+            self.metrics.clear()
+
+
+inference_executor = InferenceExecutor()
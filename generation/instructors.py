@@ -2,33 +2,35 @@ import asyncio
 import os
 import re
 import threading
-from asyncio import Semaphore
-from collections import defaultdict
+from collections import defaultdict, deque
 from logging import getLogger
 
 import requests
-from aiohttp import DummyCookieJar
-from aiohttp_client_cache import CachedSession
+from aiohttp import ClientError, DummyCookieJar
+from aiohttp_client_cache.cache_control import DO_NOT_CACHE
 from bs4 import BeautifulSoup
 from diskcache import Cache
 from tqdm.asyncio import tqdm
 
-from aio_cache import get_aio_cache
+from aio_cache import CoalescingCachedSession, get_aio_cache
 from course import Course
-from enrollment import build_from_mega_query
+from enrollment import sync_enrollment_packages
 from enrollment_data import GradeData
 from json_serializable import JsonSerializable
-from name_matcher import find_best_structured_match, find_best_name_match
+from name_matcher import NameMatcher, find_best_structured_match, parse_name
+from retry_policy import (
+    RetryableStatusError,
+    raise_for_retryable_status,
+    retry_policy,
+)
+from union_find import UnionFind
 
 faculty_url = "https://guide.wisc.edu/faculty/"
 
 rmp_url = "https://www.ratemyprofessors.com/"
 rmp_graphql_url = "https://www.ratemyprofessors.com/graphql"
 
-graph_ql_query = """
-query NewSearchTeachersQuery($query: TeacherSearchQuery!) {
-	newSearch {
-		teachers(query: $query, first: 50) {
+teacher_search_fields = """
 			didFallback
 			edges {
 				cursor
@@ -71,10 +73,42 @@ query NewSearchTeachersQuery($query: TeacherSearchQuery!) {
 					}
 				}
 			}
-		}
+"""
+
+graph_ql_query = (
+    """
+query NewSearchTeachersQuery($query: TeacherSearchQuery!) {
+	newSearch {
+		teachers(query: $query, first: 50) {"""
+    + teacher_search_fields
+    + """		}
 	}
 }
 """
+)
+
+
+def produce_batch_graph_ql_query(count):
+    """
+    Builds a GraphQL query running `count` teacher searches in a single request.
+
+    Each search is aliased as `search{i}` and takes its query from `$query{i}`.
+    """
+    variables = ", ".join(f"$query{i}: TeacherSearchQuery!" for i in range(count))
+    searches = "".join(
+        f"""
+	search{i}: newSearch {{
+		teachers(query: $query{i}, first: 50) {{"""
+        + teacher_search_fields
+        + """		}
+	}"""
+        for i in range(count)
+    )
+    return f"""
+query BatchedNewSearchTeachersQuery({variables}) {{{searches}
+}}
+"""
+
 
 logger = getLogger(__name__)
 
@@ -245,57 +279,59 @@ def produce_query(instructor_name):
 mock_user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
 
 
-async def get_rating(
+async def search_teachers(
     name: str,
     api_key: str,
     session,
     attempts: int = 10,
-    rate_limited_count: int = 0,
-    disable_cache=False,
 ):
+    """
+    Runs a single RMP teacher search, retrying on failures and rate limits.
+
+    RMP responses bypass the HTTP cache, since match results are already cached per
+    instructor with their own expiration by `cache_ratings`.
+
+    Returns:
+        The `teachers` search results, or None if the search failed on every attempt
+    """
     auth_header = {"Authorization": f"Basic {api_key}", "User-Agent": mock_user_agent}
     payload = {"query": graph_ql_query, "variables": produce_query(name)}
 
-    try:
-        if disable_cache:
-            async with session.disabled():
-                async with session.post(
-                    url=rmp_graphql_url, headers=auth_header, json=payload
-                ) as response:
-                    data = await response.json()
-        else:
-            async with session.post(
-                url=rmp_graphql_url, headers=auth_header, json=payload
-            ) as response:
-                data = await response.json()
-
-        if response.status == 429:
-            backoff = min(30, 2**rate_limited_count)
-            logger.debug(f"Rate limited, retrying after {backoff} seconds.")
-            await asyncio.sleep(backoff)
-            return await get_rating(
-                name, api_key, session, attempts, rate_limited_count + 1, disable_cache
-            )
+    async def search():
+        async with session.post(
+            url=rmp_graphql_url,
+            headers=auth_header,
+            json=payload,
+            expire_after=DO_NOT_CACHE,
+        ) as response:
+            raise_for_retryable_status(response)
+            data = await response.json()
 
         if data.get("errors"):
             raise Exception(
                 f"RMP API returned errors with status code {response.status}: {data['errors']}"
             )
+        return data
 
+    try:
+        data = await retry_policy.call(search, rmp_graphql_url, attempts=attempts)
     except Exception as e:
-        if attempts > 0:
-            logger.debug(
-                f"Failed to fetch or decode JSON response for {name} with {attempts} remaining attempts: {e}"
-            )
-            await asyncio.sleep(1)
-            return await get_rating(
-                name, api_key, session, attempts - 1, rate_limited_count, True
-            )
         logger.error(f"Failed to fetch or decode JSON response for {name}: {e}")
         return None
 
+    return data["data"]["newSearch"]["teachers"]
+
+
+async def get_rating(name: str, api_key: str, session, attempts: int = 10):
+    teachers = await search_teachers(name, api_key, session, attempts)
+    if teachers is None:
+        return None
+    return match_rating(name, teachers)
+
+
+def match_rating(name: str, teachers) -> RMPData | None:
     # Parse the results to find the best matching teacher
-    edges = data["data"]["newSearch"]["teachers"]["edges"]
+    edges = teachers["edges"]
     candidates = [item["node"] for item in edges]
 
     # Use universal name matcher to find best match
@@ -319,6 +355,153 @@ async def get_rating(
     return None
 
 
+class BatchedRatingFetcher:
+    """
+    Fetches RMP ratings for many instructors per request using aliased GraphQL searches.
+
+    Batches are fixed-size chunks of the sorted names, so every request body (and the
+    key it is recorded and replayed under by `http_replay`) only depends on the names,
+    not on scheduling or failures. Rate limits and transient errors are retried with
+    the same batch through the shared retry policy. Only when the server rejects a
+    batch itself (e.g. as too large) is it split in half and each half retried. Names
+    that fail on their own fall back to `search_teachers` and its retry handling.
+    Names are recorded in `failed` if every attempt fails.
+
+    If `cache_dir` is given, the ratings of each batch are stored with `cache_ratings`
+    as soon as the batch completes.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        session,
+        batch_size: int = 25,
+        concurrency: int = 4,
+        attempts: int = 10,
+        cache_dir: str | None = None,
+    ):
+        self.api_key = api_key
+        self.session = session
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.cache_dir = cache_dir
+        self.failed: set[str] = set()
+
+    async def fetch_all(self, names: list[str]) -> dict[str, RMPData | None]:
+        names = sorted(set(names))
+        pending = deque(
+            names[i : i + self.batch_size]
+            for i in range(0, len(names), self.batch_size)
+        )
+        ratings = {}
+        progress = tqdm(total=len(names), desc="RMP Query", unit="instructor")
+
+        async def fetch(batch):
+            batch_ratings = await self.fetch_batch(batch)
+            if batch_ratings is None:
+                # Retry the rejected batch as two halves
+                middle = len(batch) // 2
+                await fetch(batch[:middle])
+                await fetch(batch[middle:])
+                return
+            ratings.update(batch_ratings)
+            progress.update(len(batch))
+            if self.cache_dir:
+                cache_ratings(
+                    {
+                        name: rating
+                        for name, rating in batch_ratings.items()
+                        if name not in self.failed
+                    },
+                    self.cache_dir,
+                )
+
+        async def worker():
+            while pending:
+                await fetch(pending.popleft())
+
+        await asyncio.gather(*[worker() for _ in range(self.concurrency)])
+        progress.close()
+        return ratings
+
+    async def fetch_batch(self, names: list[str]) -> dict[str, RMPData | None] | None:
+        """
+        Fetches ratings for a batch of names in a single request.
+
+        Returns:
+            Mapping of each name to its rating, or None if the batch was rejected and
+            should be retried in smaller batches
+        """
+        if len(names) == 1:
+            name = names[0]
+            return {name: await self.fetch_single(name)}
+
+        auth_header = {
+            "Authorization": f"Basic {self.api_key}",
+            "User-Agent": mock_user_agent,
+        }
+        variables = {}
+        for i, name in enumerate(names):
+            variables[f"query{i}"] = produce_query(name)["query"]
+        payload = {
+            "query": produce_batch_graph_ql_query(len(names)),
+            "variables": variables,
+        }
+
+        async def post_batch():
+            async with self.session.post(
+                url=rmp_graphql_url,
+                headers=auth_header,
+                json=payload,
+                expire_after=DO_NOT_CACHE,
+            ) as response:
+                raise_for_retryable_status(response)
+                try:
+                    return response.status, await response.json(content_type=None)
+                except ValueError:
+                    return response.status, None
+
+        # Rate limits and transient errors are retried with the same batch through the
+        # shared retry policy, so they count against its budget and circuit breaker
+        try:
+            status, data = await retry_policy.call(
+                post_batch, rmp_graphql_url, attempts=self.attempts
+            )
+        except (ClientError, TimeoutError, RetryableStatusError) as e:
+            logger.error(f"Failed to fetch a batch of {len(names)} RMP queries: {e}")
+            self.failed.update(names)
+            return dict.fromkeys(names)
+
+        if not data or not data.get("data"):
+            # The server rejected the batch itself, e.g. as too large or too complex
+            errors = data.get("errors") if data else None
+            logger.debug(
+                f"RMP rejected a batch of {len(names)} queries with status code {status} "
+                f"({errors}), splitting it in half"
+            )
+            return None
+
+        ratings = {}
+        for i, name in enumerate(names):
+            search = data["data"].get(f"search{i}")
+            if search is None:
+                # This search failed within an otherwise successful batch
+                ratings[name] = await self.fetch_single(name)
+                continue
+            ratings[name] = match_rating(name, search["teachers"])
+        return ratings
+
+    async def fetch_single(self, name: str) -> RMPData | None:
+        teachers = await search_teachers(
+            name, self.api_key, self.session, self.attempts
+        )
+        if teachers is None:
+            self.failed.add(name)
+            return None
+        return match_rating(name, teachers)
+
+
 def scrape_rmp_api_key():
     response = requests.get(
         rmp_url, headers={"User-Agent": "Mozilla/5.0"}
@@ -366,13 +549,93 @@ def get_faculty():
     return faculty
 
 
+class FacultyDirectory(JsonSerializable):
+    """
+    Faculty directory indexed for name lookups.
+
+    Names are parsed once into normalized (first, last) pairs. Lookups first try an
+    exact hit on the first name or one of its tokens together with the last name, and
+    otherwise fall back to a NameMatcher, which only fuzzy matches against faculty
+    sharing the exact last name.
+    """
+
+    def __init__(
+        self,
+        faculty: dict[str, tuple[str | None, str | None, str | None]],
+        parsed_names: dict[str, tuple[str, str]] | None = None,
+    ):
+        self.faculty = faculty
+        self.parsed_names = parsed_names or {name: parse_name(name) for name in faculty}
+
+        self.matcher = NameMatcher(list(faculty), parsed_names=self.parsed_names)
+        self.first_last_index: dict[tuple[str, str], str] = {}
+        for name, (first, last) in self.parsed_names.items():
+            if not first or not last:
+                continue
+            for variant in [first, *first.split()]:
+                self.first_last_index.setdefault((variant, last), name)
+
+    @classmethod
+    def from_json(cls, json_data) -> "FacultyDirectory":
+        return FacultyDirectory(
+            faculty={
+                name: tuple(details) for name, details in json_data["faculty"].items()
+            },
+            parsed_names={
+                name: tuple(parsed)
+                for name, parsed in json_data["parsed_names"].items()
+            },
+        )
+
+    def to_dict(self):
+        return {
+            "faculty": {name: list(details) for name, details in self.faculty.items()},
+            "parsed_names": {
+                name: list(parsed) for name, parsed in self.parsed_names.items()
+            },
+        }
+
+    def match(self, name: str, threshold=80) -> str | None:
+        """
+        Match an instructor name against the faculty directory.
+
+        Returns:
+            Matched faculty name or None if no match found
+        """
+        first, last = parse_name(name)
+        if not first or not last:
+            return None
+
+        exact_match = self.first_last_index.get((first, last))
+        if exact_match is not None:
+            return exact_match
+
+        match_result = self.matcher.match_parsed(name, first, last, threshold)
+        return match_result.matched_item if match_result.is_match else None
+
+    def __getitem__(self, name: str):
+        return self.faculty[name]
+
+
 _caches: dict[str, Cache] = {}
 _caches_lock = threading.Lock()
 
 
 def get_match_cache(cache_dir: str) -> Cache:
+    return get_disk_cache(cache_dir, "name_cache")
+
+
+def get_rmp_result_cache(cache_dir: str) -> Cache:
+    return get_disk_cache(cache_dir, "rmp_cache")
+
+
+def get_faculty_cache(cache_dir: str) -> Cache:
+    return get_disk_cache(cache_dir, "faculty_cache")
+
+
+def get_disk_cache(cache_dir: str, name: str) -> Cache:
     # build one canonical directory for your cache
-    path = os.path.abspath(os.path.join(cache_dir, "name_cache"))
+    path = os.path.abspath(os.path.join(cache_dir, name))
     os.makedirs(path, exist_ok=True)
 
     with _caches_lock:
@@ -386,121 +649,252 @@ def get_match_cache(cache_dir: str) -> Cache:
 null_sentinel = object()
 
 
-def match_name(
-    student_name, official_names, cache_dir, query_cache_group, threshold=80
+class MemoryFrontCache:
+    """
+    In-memory front for a diskcache Cache.
+
+    Every entry is loaded into a dict up front, so lookups and writes during a step
+    never touch SQLite. New entries are written back in batched transactions when
+    `flush` is called.
+    """
+
+    def __init__(self, cache: Cache, flush_batch_size: int = 1000):
+        self.cache = cache
+        self.flush_batch_size = flush_batch_size
+        self.entries = {}
+        self.dirty = {}
+        for key in cache.iterkeys():
+            value = cache.get(key, default=null_sentinel)
+            if value is not null_sentinel:
+                self.entries[key] = value
+
+    def get(self, key, default=None):
+        return self.entries.get(key, default)
+
+    def set(self, key, value):
+        self.entries[key] = value
+        self.dirty[key] = value
+
+    def flush(self):
+        dirty_items = list(self.dirty.items())
+        for start in range(0, len(dirty_items), self.flush_batch_size):
+            with self.cache.transact():
+                for key, value in dirty_items[start : start + self.flush_batch_size]:
+                    self.cache.set(key, value)
+        self.dirty.clear()
+
+
+rmp_hit_ttl = 30 * 24 * 60 * 60  # 30 days
+rmp_miss_ttl = 7 * 24 * 60 * 60  # 7 days
+faculty_ttl = 7 * 24 * 60 * 60  # 7 days
+
+
+def get_faculty_directory(cache_dir: str, ttl=faculty_ttl) -> FacultyDirectory:
+    """
+    Loads the indexed faculty directory, scraping and parsing the faculty page only
+    when no cached directory exists or it is older than `ttl` seconds.
+    """
+    cache = get_faculty_cache(cache_dir)
+    cache_entry = cache.get("faculty", default=null_sentinel)
+    if cache_entry is not null_sentinel:
+        return FacultyDirectory.from_json(cache_entry)
+
+    faculty_directory = FacultyDirectory(get_faculty())
+    cache.set("faculty", faculty_directory.to_dict(), expire=ttl)
+    logger.info(f"Indexed {len(faculty_directory.faculty)} faculty members.")
+    return faculty_directory
+
+
+def get_cached_ratings(
+    names: list[str], cache_dir: str
+) -> tuple[dict[str, RMPData | None], list[str]]:
+    """
+    Looks up RMP match results from previous runs.
+
+    Returns:
+        Tuple of (mapping of cached names to their rating or None for "no match",
+        list of names that are not cached or have expired)
+    """
+    cache = get_rmp_result_cache(cache_dir)
+    cached_ratings = {}
+    uncached_names = []
+    for name in names:
+        cache_entry = cache.get(f"rmp:{name.strip().upper()}", default=null_sentinel)
+        if cache_entry is null_sentinel:
+            uncached_names.append(name)
+        else:
+            cached_ratings[name] = RMPData.from_json(cache_entry)
+    return cached_ratings, uncached_names
+
+
+def cache_ratings(
+    ratings: dict[str, RMPData | None],
+    cache_dir: str,
+    hit_ttl=rmp_hit_ttl,
+    miss_ttl=rmp_miss_ttl,
+):
+    """
+    Stores RMP match results, expiring matches after `hit_ttl` seconds and
+    "no match" results after `miss_ttl` seconds.
+    """
+    cache = get_rmp_result_cache(cache_dir)
+    with cache.transact():
+        for name, rating in ratings.items():
+            cache.set(
+                f"rmp:{name.strip().upper()}",
+                rating.to_dict() if rating else None,
+                expire=hit_ttl if rating else miss_ttl,
+            )
+
+
+def match_names(
+    student_names,
+    matcher: NameMatcher,
+    cache: MemoryFrontCache,
+    query_cache_group,
+    threshold=80,
 ):
     """
-    Match an instructor name against a list of official names.
+    Match instructor names against a list of official names.
 
-    Uses disk cache for performance and delegates to universal name matcher.
+    Uses the name match cache for performance and matches the uncached names in one
+    batch with the universal name matcher.
 
     Args:
-        student_name: Name to match
-        official_names: Set or list of official names to match against
-        cache_dir: Directory for disk cache
+        student_names: Names to match
+        matcher: NameMatcher over the official names to match against
+        cache: In-memory name match cache, flushed to disk by the caller
         query_cache_group: Cache group identifier (e.g., "rmp", "instructors")
         threshold: Minimum confidence score (0-100) required for match
 
     Returns:
-        Matched name string or None if no match found
+        Mapping of each name to its matched name string, or None if no match found
     """
-    cache = get_match_cache(cache_dir)
-    cache_key = f"{query_cache_group}:{student_name.strip().upper()}"
-
     # Check cache first
-    cache_entry = cache.get(cache_key, default=null_sentinel)
-    if cache_entry is not null_sentinel:
-        return cache_entry
+    matches = {}
+    uncached_names = []
+    for student_name in student_names:
+        cache_key = f"{query_cache_group}:{student_name.strip().upper()}"
+        cache_entry = cache.get(cache_key, default=null_sentinel)
+        if cache_entry is not null_sentinel:
+            matches[student_name] = cache_entry
+        else:
+            uncached_names.append(student_name)
 
     # Use universal name matcher
-    match_result = find_best_name_match(
-        query_name=student_name,
-        candidates=list(official_names),
-        threshold=threshold,
-        require_exact_last=True,
-    )
+    match_results = matcher.match_many(uncached_names, threshold=threshold, workers=-1)
 
-    result = match_result.matched_item if match_result.is_match else None
+    # Cache the results
+    for student_name, match_result in zip(uncached_names, match_results):
+        result = match_result.matched_item if match_result.is_match else None
+        cache.set(f"{query_cache_group}:{student_name.strip().upper()}", result)
+        matches[student_name] = result
 
-    # Cache the result
-    cache.set(cache_key, result)
-    return result
+    return matches
 
 
-def generate_instructor_merge_diff(
-    instructor: str,
+def resolve_instructor_identities(
     instructors: dict[str, str | None],
-    appearances: dict[str, list[tuple[Course.Reference, str]]],
-    cache_dir: str,
-) -> list[dict]:
-    diffs = []
-    match = match_name(instructor, set(instructors.keys()), cache_dir, "instructors")
-
-    if match and match != instructor:
-        # only iterate the courses/terms where this instructor actually shows up
-        for course_ref, term in appearances.get(instructor, []):
-            diffs.append(
-                {
-                    "type": "replace_in_course",
-                    "course_ref": course_ref,
-                    "term": term,
-                    "old": instructor,
-                    "new": match,
-                }
+    additional_instructors: set[str],
+    instructor_appearances: dict[str, int],
+    name_cache: MemoryFrontCache,
+) -> dict[str, str]:
+    """
+    Clusters instructor name variants into canonical instructors in one blocked pass.
+
+    Each name from the grade data is unioned with its matching instructor from the
+    enrollment data. Names without one are visited from most to least frequent, and
+    each joins the most frequent cluster whose canonical name it matches, or starts its
+    own. Matching the canonical name rather than any member keeps subset names from
+    chaining ("Mary Smith" ~ "Mary Ann Smith" ~ "Ann Smith"). Each cluster is named
+    after its enrollment instructor if it has one, and otherwise after its most
+    frequent name, which is added to `instructors`.
+
+    Args:
+        instructors: Mapping of instructor names from the enrollment data to emails
+        additional_instructors: Instructor names from the grade data
+        instructor_appearances: Number of course terms each grade data name appears in
+        name_cache: In-memory name match cache
+
+    Returns:
+        Mapping of every renamed variant to its canonical instructor name
+    """
+    variants = [name for name in additional_instructors if name not in instructors]
+    matches = match_names(
+        variants, NameMatcher(list(instructors)), name_cache, "instructors"
+    )
+
+    identities = UnionFind(variants)
+    for variant, match in matches.items():
+        if match:
+            identities.union(match, variant)
+
+    unmatched = sorted(
+        (variant for variant in variants if not matches[variant]),
+        key=lambda name: (-instructor_appearances.get(name, 0), name),
+    )
+    similar_names = defaultdict(set)
+    for variant, other in NameMatcher(unmatched).similar_pairs():
+        similar_names[variant].add(other)
+        similar_names[other].add(variant)
+
+    rank = {name: position for position, name in enumerate(unmatched)}
+    canonicals = set()
+    for variant in unmatched:
+        matching = similar_names[variant] & canonicals
+        if matching:
+            identities.union(min(matching, key=rank.__getitem__), variant)
+        else:
+            canonicals.add(variant)
+
+    renames = {}
+    clusters = identities.groups()
+    for members in clusters:
+        canonical = next((name for name in members if name in instructors), None)
+        if canonical is None:
+            canonical = max(
+                sorted(members), key=lambda name: instructor_appearances.get(name, 0)
             )
-    elif match is None:
-        diffs.append(
-            {
-                "type": "add_instructor",
-                "instructor": instructor,
-            }
-        )
+            instructors[canonical] = None
+        for name in members:
+            if name != canonical:
+                renames[name] = canonical
 
-    return diffs
+    logger.info(
+        f"Resolved {len(variants)} instructor name variants into "
+        f"{len(clusters)} instructors ({len(renames)} renamed)."
+    )
+    return renames
 
 
 async def merge_instructors(
-    additional_instructors, instructors, course_ref_to_course, cache_dir
+    additional_instructors, instructors, course_ref_to_course, name_cache
 ):
-    instructor_appearances: dict[str, list[tuple[Course.Reference, str]]] = defaultdict(
-        list
-    )
-    for course_ref, course in course_ref_to_course.items():
-        for term, term_data in course.term_data.items():
+    instructor_appearances: dict[str, int] = defaultdict(int)
+    for course in course_ref_to_course.values():
+        for term_data in course.term_data.values():
             if term_data.grade_data:
                 for instr in term_data.grade_data.instructors:
-                    instructor_appearances[instr].append((course_ref, term))
-
-    tasks = [
-        asyncio.to_thread(
-            generate_instructor_merge_diff,
-            inst,
-            instructors,
-            instructor_appearances,
-            cache_dir,
-        )
-        for inst in additional_instructors
-    ]
-
-    all_diffs = await tqdm.gather(
-        *tasks, desc="Generate Instructor Diff", unit="instructor"
+                    instructor_appearances[instr] += 1
+
+    renames = await asyncio.to_thread(
+        resolve_instructor_identities,
+        instructors,
+        additional_instructors,
+        instructor_appearances,
+        name_cache,
     )
 
-    for difflist in tqdm(all_diffs, desc="Merge Instructor Diff", unit="diff"):
-        for diff in difflist:
-            if diff["type"] == "add_instructor":
-                instructors[diff["instructor"]] = None
-            elif diff["type"] == "replace_in_course":
-                cr = diff["course_ref"]
-                term = diff["term"]
-                gd = course_ref_to_course[cr].term_data[term].grade_data
-                gd.instructors.remove(diff["old"])
-                gd.instructors.add(diff["new"])
-
-
-async def sem_get_rating(sem: asyncio.Semaphore, name, api_key, session):
-    async with sem:
-        return await get_rating(name, api_key, session)
+    # Apply all renames in a single pass over the grade data
+    for course in course_ref_to_course.values():
+        for term_data in course.term_data.values():
+            if not term_data.grade_data:
+                continue
+            gd = term_data.grade_data
+            renamed = [instr for instr in gd.instructors if instr in renames]
+            for instr in renamed:
+                gd.instructors.remove(instr)
+                gd.instructors.add(renames[instr])
 
 
 async def get_ratings(
@@ -509,7 +903,8 @@ async def get_ratings(
     course_ref_to_course: dict[Course.Reference, Course],
     cache_dir,
 ):
-    faculty = get_faculty()  # Assuming these functions are fast/synchronous.
+    faculty_directory = await asyncio.to_thread(get_faculty_directory, cache_dir)
+    name_cache = await asyncio.to_thread(MemoryFrontCache, get_match_cache(cache_dir))
 
     additional_instructors = set()
 
@@ -527,7 +922,7 @@ async def get_ratings(
                     additional_instructors.add(instructor)
 
     await merge_instructors(
-        additional_instructors, instructors, course_ref_to_course, cache_dir
+        additional_instructors, instructors, course_ref_to_course, name_cache
     )
 
     instructor_data = {}
@@ -536,30 +931,29 @@ async def get_ratings(
 
     logger.info(f"Fetching ratings for {total} instructors...")
 
-    async with CachedSession(
+    async with CoalescingCachedSession(
         cache=get_aio_cache(), cookie_jar=DummyCookieJar()
     ) as session:
-        semaphore = Semaphore(10)
-        tasks = []
         names_emails = list(instructors.items())
-        for i, (name, email) in enumerate(names_emails):
-            logger.debug(f"Fetching rating for {name} ({i * 100 / total:.2f}%).")
-            # Create a task to get the rating for each instructor
-            tasks.append(sem_get_rating(semaphore, name, api_key, session))
+        name_to_rating, uncached_names = get_cached_ratings(
+            [name for name, _ in names_emails], cache_dir
+        )
+        logger.info(
+            f"Resolved {len(name_to_rating)} instructors from the RMP result cache."
+        )
 
-        # Run all rating requests concurrently
-        ratings = await tqdm.gather(*tasks, desc="RMP Query", unit="instructor")
+        fetcher = BatchedRatingFetcher(api_key, session, cache_dir=cache_dir)
+        fetched_ratings = await fetcher.fetch_all(uncached_names)
 
-        faculty_names = set(faculty.keys())
+        name_to_rating.update(fetched_ratings)
+        ratings = [name_to_rating[name] for name, _ in names_emails]
 
         async def _process_one(name_email, rating):
             instructor_name, instructor_email = name_email
-            match = await asyncio.to_thread(
-                match_name, instructor_name, faculty_names, cache_dir, "rmp"
-            )
+            match = faculty_directory.match(instructor_name)
 
             if match:
-                position, department, credentials = faculty[match]
+                position, department, credentials = faculty_directory[match]
                 logger.debug(
                     f"Matched {instructor_name} to {match} ({position}, {department}, {credentials})"
                 )
@@ -592,6 +986,8 @@ async def get_ratings(
                 with_ratings += 1
             instructor_data[name] = inst
 
+    await asyncio.to_thread(name_cache.flush)
+
     logger.info(
         f"Found instructor_data for {with_ratings} out of {total} instructors ({with_ratings * 100 / total:.2f}%)."
     )
@@ -601,25 +997,12 @@ async def get_ratings(
 async def gather_instructor_emails(terms, course_ref_to_course):
     combined_emails = {}
     combined_meetings = {}
-    # sort terms so that later (i.e. 'larger') keys override earlier ones
-    sorted_terms = sorted(terms.keys())
-    # Create a list of tasks, one per term
-    tasks = [
-        build_from_mega_query(
-            selected_term=str(term),
-            term_name=terms[term],
-            terms=terms,
-            course_ref_to_course=course_ref_to_course,
-        )
-        for term in sorted_terms
-    ]
-    # Run all tasks concurrently
-    results = await tqdm.gather(*tasks, desc="Term Query", unit="term")
-    # Merge dictionaries; later ones override earlier ones for duplicate keys
-    for term, result in zip(sorted_terms, results):
-        if not result:
-            continue
-        emails, meetings = result  # Unpack the tuple returned by build_from_mega_query
+    term_to_results = await sync_enrollment_packages(
+        terms=terms, course_ref_to_course=course_ref_to_course
+    )
+    # Merge in term order so that later (i.e. 'larger') terms override earlier ones
+    for term in sorted(term_to_results):
+        emails, meetings = term_to_results[term]
         combined_emails.update(emails)
         # Merge meetings, combining sets for the same course
         for course_reference, course_meetings in meetings.items():
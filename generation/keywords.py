@@ -0,0 +1,85 @@
+"""
+Statistical keyword extraction, as a quick alternative to KeyBERT that needs no model.
+
+Every course description is scored in one vectorized TF-IDF pass over 1-2 word
+phrases, so the distinctive phrases of a description across the catalog become its
+keywords.
+"""
+
+from logging import getLogger
+
+import numpy as np
+
+logger = getLogger(__name__)
+
+keyword_engines = ("keybert", "tfidf")
+
+
+def extract_tfidf_keywords(
+    docs: list[str], keyphrase_ngram_range=(1, 2), stop_words="english", top_n=5
+) -> list[list[str]]:
+    """
+    Extracts the top TF-IDF phrases of each document, with the whole list of
+    documents as the corpus.
+
+    Returns:
+        Keywords of each document, highest scoring first, with ties broken
+        alphabetically
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(
+        ngram_range=keyphrase_ngram_range, stop_words=stop_words, sublinear_tf=True
+    )
+    try:
+        scores = vectorizer.fit_transform(docs).tocsr()
+    except ValueError:
+        # Only stop words, or no words at all
+        return [[] for _ in docs]
+    terms = vectorizer.get_feature_names_out()
+
+    keywords = []
+    for row in range(scores.shape[0]):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        indices = scores.indices[start:end]
+        top = np.lexsort((indices, -scores.data[start:end]))[:top_n]
+        keywords.append(terms[indices[top]].tolist())
+    return keywords
+
+
+def keyword_overlap(
+    reference: dict[str, list[str]], candidate: dict[str, list[str]]
+) -> dict:
+    """
+    Compares the keywords of two engines over the courses both have keywords for.
+
+    Returns:
+        Dictionary of the number of courses compared, the mean Jaccard similarity of
+        their keyword sets, the mean fraction of candidate keywords found in the
+        reference, and how often their first keywords agree
+    """
+    identifiers = [
+        identifier
+        for identifier in reference
+        if reference[identifier] and candidate.get(identifier)
+    ]
+    if not identifiers:
+        return {"courses": 0}
+
+    jaccard = []
+    precision = []
+    first_agreement = 0
+    for identifier in identifiers:
+        reference_keywords = set(reference[identifier])
+        candidate_keywords = set(candidate[identifier])
+        shared = len(reference_keywords & candidate_keywords)
+        jaccard.append(shared / len(reference_keywords | candidate_keywords))
+        precision.append(shared / len(candidate_keywords))
+        first_agreement += reference[identifier][0] == candidate[identifier][0]
+
+    return {
+        "courses": len(identifiers),
+        "mean_jaccard": float(np.mean(jaccard)),
+        "mean_precision": float(np.mean(precision)),
+        "first_keyword_agreement": first_agreement / len(identifiers),
+    }
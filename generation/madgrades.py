@@ -1,14 +1,16 @@
-import asyncio
+from contextlib import nullcontext
 from logging import getLogger
 
 import aiohttp
 import requests
-from aiohttp_client_cache import CachedSession
+import requests_cache
+from aiohttp_client_cache.cache_control import DO_NOT_CACHE
 from tqdm.asyncio import tqdm
 
-from aio_cache import get_aio_cache
+from aio_cache import CoalescingCachedSession, get_aio_cache
 from course import Course
 from enrollment_data import MadgradesData, TermData
+from retry_policy import raise_for_retryable_status, retry_policy
 
 madgrades_api_endpoint = "https://api.madgrades.com/v1/"
 page_size = 100
@@ -16,22 +18,72 @@ page_size = 100
 logger = getLogger(__name__)
 
 
-def get_madgrades_terms(madgrades_api_key) -> dict[int, str]:
+def get_madgrades_terms(madgrades_api_key, refresh=False) -> dict[int, str]:
+    """
+    Args:
+        refresh: Whether to bypass the requests cache, e.g. to see newly published terms
+    """
     logger.info("Fetching Madgrades terms...")
     auth_header = {"Authorization": f"Token token={madgrades_api_key}"}
-    response = requests.get(url=madgrades_api_endpoint + "terms", headers=auth_header)
+    with requests_cache.disabled() if refresh else nullcontext():
+        response = requests.get(
+            url=madgrades_api_endpoint + "terms", headers=auth_header
+        )
     return {
         int(term_code): term_name for term_code, term_name in response.json().items()
     }
 
 
+def needs_madgrades_refresh(
+    madgrades_data: MadgradesData | None,
+    new_terms: set[str],
+    recent_terms: set[str],
+) -> bool:
+    """
+    Determines whether a course's cached Madgrades data may be missing offerings.
+
+    Historic grade distributions never change, so a course only needs to be fetched
+    again if it is unknown to the cache, or if Madgrades published terms we have not
+    synced yet and the course was offered recently enough to plausibly appear in them.
+
+    Args:
+        madgrades_data: Cached Madgrades data for the course, if any
+        new_terms: Madgrades term codes not present in any cached course
+        recent_terms: The most recent term codes already present in the cache
+
+    Returns:
+        True if the course's grades should be fetched from Madgrades
+    """
+    if madgrades_data is None:
+        return True
+    if not new_terms:
+        return False
+    return not recent_terms.isdisjoint(madgrades_data.by_term.keys())
+
+
+def apply_madgrades_data(course: Course, madgrades_data: MadgradesData):
+    course.cumulative_grade_data = madgrades_data.cumulative
+
+    for term, grade_data in madgrades_data.by_term.items():
+        term_data = TermData(None, None)
+        if course.term_data.get(term):
+            term_data = course.term_data[term]
+
+        term_data.grade_data = grade_data
+        course.term_data[term] = term_data
+
+
 async def process_course(
     session,
     madgrade_course,
     course_ref_to_course,
+    course_ref_to_madgrades,
     madgrades_api_key,
     current_page,
     total_pages,
+    new_terms=None,
+    recent_terms=None,
+    expire_after=None,
 ):
     course_number = madgrade_course["number"]
     subjects = madgrade_course["subjects"]
@@ -42,42 +94,58 @@ async def process_course(
         logger.debug(f"Unknown course discovered from Madgrades: {course_ref}")
         return
 
+    cached_data = course_ref_to_madgrades.get(course_ref)
+    if new_terms is not None and not needs_madgrades_refresh(
+        cached_data, new_terms, recent_terms
+    ):
+        logger.debug(f"Using cached madgrades data for course {course_ref}")
+        return
+
     grades_url = madgrade_course["url"] + "/grades"
     madgrades_data = await MadgradesData.from_madgrades_async(
-        session, grades_url, madgrades_api_key, current_page, attempts=10
+        session,
+        grades_url,
+        madgrades_api_key,
+        current_page,
+        attempts=10,
+        expire_after=expire_after,
     )
-    course = course_ref_to_course[course_ref]
-    course.cumulative_grade_data = madgrades_data.cumulative
-
-    for term, grade_data in madgrades_data.by_term.items():
-        term_data = TermData(None, None)
-        if course.term_data.get(term):
-            term_data = course.term_data[term]
-
-        term_data.grade_data = grade_data
-        course.term_data[term] = term_data
+    if madgrades_data is None:
+        return
+    if cached_data:
+        madgrades_data = cached_data.merge_with(madgrades_data)
+    course_ref_to_madgrades[course_ref] = madgrades_data
 
     logger.debug(
-        f"Adding madgrades data to course {course_ref} of page {current_page}/{total_pages}"
+        f"Fetched madgrades data for course {course_ref} of page {current_page}/{total_pages}"
     )
 
 
-async def fetch_and_process_page(session, url, course_ref_to_course, key, attempts=5):
-    async with session.get(
-        url, headers={"Authorization": f"Token token={key}"}
-    ) as resp:
-        try:
-            data = await resp.json()
-        except Exception as e:
-            if attempts > 0:
-                logger.warning(f"Failed to fetch page {url}: {e}. Retrying...")
-                await asyncio.sleep(1)
-                await fetch_and_process_page(
-                    session, url, course_ref_to_course, key, attempts - 1
-                )
-            else:
-                logger.warning(f"Failed to fetch page {url}: {e}")
-            return
+async def fetch_and_process_page(
+    session,
+    url,
+    course_ref_to_course,
+    course_ref_to_madgrades,
+    key,
+    new_terms=None,
+    recent_terms=None,
+    expire_after=None,
+    attempts=5,
+):
+    async def fetch_page():
+        async with session.get(
+            url,
+            headers={"Authorization": f"Token token={key}"},
+            expire_after=expire_after,
+        ) as resp:
+            raise_for_retryable_status(resp)
+            return await resp.json()
+
+    try:
+        data = await retry_policy.call(fetch_page, url, attempts=attempts)
+    except Exception as e:
+        logger.warning(f"Failed to fetch page {url}: {e}")
+        return
 
     current_page = data["currentPage"]
     total_pages = data["totalPages"]
@@ -85,7 +153,16 @@ async def fetch_and_process_page(session, url, course_ref_to_course, key, attemp
     await tqdm.gather(
         *[
             process_course(
-                session, course, course_ref_to_course, key, current_page, total_pages
+                session,
+                course,
+                course_ref_to_course,
+                course_ref_to_madgrades,
+                key,
+                current_page,
+                total_pages,
+                new_terms,
+                recent_terms,
+                expire_after,
             )
             for course in data["results"]
         ],
@@ -97,22 +174,87 @@ async def fetch_and_process_page(session, url, course_ref_to_course, key, attemp
     )
 
 
-async def add_madgrades_data(course_ref_to_course, madgrades_api_key):
+async def add_madgrades_data(
+    course_ref_to_course,
+    madgrades_api_key,
+    course_ref_to_madgrades,
+    incremental=False,
+    recent_term_window=6,
+):
+    """
+    Adds Madgrades grade data to every known course.
+
+    Fetched data is stored in `course_ref_to_madgrades`, which may be pre-populated
+    from the cache. In incremental mode, only courses that are missing from it or
+    that may have offerings in newly published Madgrades terms are fetched.
+
+    Args:
+        course_ref_to_course: Mapping of course references to courses
+        madgrades_api_key: Madgrades API token
+        course_ref_to_madgrades: Mapping of course references to cached MadgradesData
+        incremental: Whether to skip courses whose cached data is up to date
+        recent_term_window: Number of most recent cached terms a course must have been
+            offered in to be considered for new offerings
+
+    Returns:
+        The Madgrades terms, mapping term codes to term names
+    """
+    # The HTTP caches never expire, so incremental syncs bypass them to see newly
+    # published terms; the per-course Madgrades store is their cache instead
+    terms = get_madgrades_terms(madgrades_api_key, refresh=incremental)
+    expire_after = DO_NOT_CACHE if incremental else None
+
+    new_terms = None
+    recent_terms = None
+    if incremental:
+        cached_terms = {
+            term
+            for madgrades_data in course_ref_to_madgrades.values()
+            for term in madgrades_data.by_term
+        }
+        new_terms = {str(term) for term in terms} - cached_terms
+        recent_terms = set(sorted(cached_terms, key=int)[-recent_term_window:])
+        logger.info(
+            f"Incremental Madgrades sync with {len(course_ref_to_madgrades)} cached courses "
+            f"and {len(new_terms)} new terms: {sorted(new_terms)}"
+        )
+
     base = madgrades_api_endpoint + "courses"
     params = f"?per_page={page_size}"
     connector = aiohttp.TCPConnector(limit_per_host=10)
-    async with CachedSession(cache=get_aio_cache(), connector=connector) as session:
+    async with CoalescingCachedSession(
+        cache=get_aio_cache(), connector=connector
+    ) as session:
         first_url = base + params
-        async with session.get(
-            first_url, headers={"Authorization": f"Token token={madgrades_api_key}"}
-        ) as resp:
-            first = await resp.json()
+
+        async def fetch_first_page():
+            async with session.get(
+                first_url,
+                headers={"Authorization": f"Token token={madgrades_api_key}"},
+                expire_after=expire_after,
+            ) as resp:
+                raise_for_retryable_status(resp)
+                return await resp.json()
+
+        first = await retry_policy.call(fetch_first_page, first_url)
         total = first["totalPages"]
         urls = [f"{base}{params}&page={i}" for i in range(1, total + 1)]
         [
             await fetch_and_process_page(
-                session, url, course_ref_to_course, madgrades_api_key
+                session,
+                url,
+                course_ref_to_course,
+                course_ref_to_madgrades,
+                madgrades_api_key,
+                new_terms,
+                recent_terms,
+                expire_after,
             )
             for url in tqdm(urls, desc="Madgrades Data Worker", unit="page")
         ]
-    return get_madgrades_terms(madgrades_api_key)
+
+    for course_ref, madgrades_data in course_ref_to_madgrades.items():
+        if course_ref in course_ref_to_course:
+            apply_madgrades_data(course_ref_to_course[course_ref], madgrades_data)
+
+    return terms
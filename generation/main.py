@@ -3,6 +3,7 @@ import logging
 import os
 import socket
 import sys
+import time
 from argparse import ArgumentParser
 from logging import getLogger
 from os import environ
@@ -15,6 +16,7 @@ from requests_cache import NEVER_EXPIRE
 from tqdm.contrib.logging import logging_redirect_tqdm
 
 from aggregate import aggregate_instructors, aggregate_courses
+import http_replay
 from aio_cache import set_aio_cache_location, set_aio_cache_expiration
 from cache import (
     read_course_ref_to_course_cache,
@@ -34,6 +36,10 @@ from cache import (
     write_new_terms_cache,
     write_course_ref_to_meetings_cache,
     read_course_ref_to_meetings_cache,
+    read_course_ref_to_madgrades_cache,
+    write_course_ref_to_madgrades_cache,
+    read_requisite_parse_memo_cache,
+    write_requisite_parse_memo_cache,
 )
 from cytoscape import (
     build_graphs,
@@ -41,11 +47,22 @@ from cytoscape import (
     generate_styles,
     generate_style_from_graph,
 )
-from embeddings import optimize_prerequisites, get_model
+from embeddings import (
+    compare_model_precision,
+    get_model,
+    model_precisions,
+    optimize_prerequisites,
+    set_model_precision,
+)
 from enrollment import sync_enrollment_terms
+from inference import inference_executor
 from instructors import get_ratings, gather_instructor_emails, scrape_rmp_api_key
+from keywords import keyword_engines
 from madgrades import add_madgrades_data
+from requirement_ast import dump_parse_memo, find_tokenizer_mismatches, load_parse_memo
+from retry_policy import retry_policy
 from save import write_data
+from timer import get_ms
 from webscrape import get_course_urls, scrape_all, build_subject_to_courses
 
 load_dotenv()
@@ -78,8 +95,7 @@ def generate_parser():
             "optimize",
             "graph",
         ],
-        help="Strategy for generating course map data.",
-        required=True,
+        help="Strategy for generating course map data. Required unless --verify_requisites is given.",
     )
     parser.add_argument(
         "--max_prerequisites",
@@ -87,6 +103,69 @@ def generate_parser():
         help="Maximum number of prerequisites to keep for each course.",
         default=1,
     )
+    parser.add_argument(
+        "--incremental_madgrades",
+        action="store_true",
+        help="Only fetch Madgrades grades for courses missing from the cache or recently offered when new terms are published.",
+    )
+    parser.add_argument(
+        "--verify_requisites",
+        action="store_true",
+        help="Check the requisite tokenizer against its multi-pass reference on every cached course, failing on any mismatch. Runs without any step unless --step is given.",
+    )
+    parser.add_argument(
+        "--keyword_engine",
+        choices=keyword_engines,
+        help="Keyword extraction engine of the aggregate step. tfidf is a quick statistical alternative to KeyBERT that loads no model.",
+        default="keybert",
+    )
+    parser.add_argument(
+        "--embedding_precision",
+        choices=model_precisions,
+        help="Inference precision of the embedding model on CPU. Reduced precisions are faster but change embeddings slightly.",
+        default="fp32",
+    )
+    parser.add_argument(
+        "--check_embedding_precision",
+        action="store_true",
+        help="Compare nearest neighbors and prerequisite selections of --embedding_precision against fp32 on the cached courses.",
+    )
+    parser.add_argument(
+        "--torch_threads",
+        type=int,
+        help="Intra-op threads torch uses for inference, split evenly between the inference workers. Defaults to the number of CPUs.",
+        default=None,
+    )
+    parser.add_argument(
+        "--inference_workers",
+        type=int,
+        help="Threads running model inference concurrently.",
+        default=1,
+    )
+    parser.add_argument(
+        "--record",
+        type=str,
+        help="Record upstream HTTP interactions to the given fixture archive (.jsonl.gz).",
+        default=None,
+    )
+    parser.add_argument(
+        "--replay",
+        type=str,
+        help="Serve upstream HTTP interactions from the given fixture archive instead of the network.",
+        default=None,
+    )
+    parser.add_argument(
+        "--replay_latency_ms",
+        type=float,
+        help="Mean latency injected into replayed requests, in milliseconds.",
+        default=0.0,
+    )
+    parser.add_argument(
+        "--replay_error_rate",
+        type=float,
+        help="Fraction of replayed aiohttp requests that fail with a 503. Unretried sync requests are never failed.",
+        default=0.0,
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -118,12 +197,16 @@ def courses():
 
 def madgrades(
     course_ref_to_course,
+    course_ref_to_madgrades,
     madgrades_api_key,
+    incremental,
 ):
     terms = asyncio.run(
         add_madgrades_data(
             course_ref_to_course=course_ref_to_course,
             madgrades_api_key=madgrades_api_key,
+            course_ref_to_madgrades=course_ref_to_madgrades,
+            incremental=incremental,
         )
     )
 
@@ -234,30 +317,45 @@ def main():
     parser = generate_parser()
     args = parser.parse_args()
 
+    if args.step is None and not args.verify_requisites:
+        parser.error("--step is required unless --verify_requisites is given")
+
     data_dir = environ.get("DATA_DIR", None)
-    if data_dir is None:
+    if data_dir is None and args.step is not None:
         raise_missing_env_var("DATA_DIR")
 
     cache_dir = str(args.cache_dir)
     os.makedirs(cache_dir, exist_ok=True)  # Ensure the cache directory exists
 
-    requests_cache_location = path.join(cache_dir, "requests_cache")
-    requests_cache.install_cache(
-        cache_name=requests_cache_location, expires_after=NEVER_EXPIRE
-    )
+    if args.record and args.replay:
+        parser.error("--record and --replay are mutually exclusive")
+
+    # Sync requests bypass the requests cache while recording or replaying, so that
+    # every interaction reaches the archive.
+    if not args.record and not args.replay:
+        requests_cache_location = path.join(cache_dir, "requests_cache")
+        requests_cache.install_cache(
+            cache_name=requests_cache_location, expires_after=NEVER_EXPIRE
+        )
 
     set_aio_cache_location(path.join(cache_dir, "aio_cache"))
     set_aio_cache_expiration(NEVER_EXPIRE)
 
+    set_model_precision(args.embedding_precision)
+    inference_executor.configure(
+        intra_op_threads=args.torch_threads, workers=args.inference_workers
+    )
+
     madgrades_api_key = environ.get("MADGRADES_API_KEY", None)
 
     step = str(args.step).lower()
     max_prerequisites = int(args.max_prerequisites)
     verbose = bool(args.verbose) or env_debug()
     no_build = bool(args.no_build)
+    incremental_madgrades = bool(args.incremental_madgrades)
 
     sitemap_base_url = environ.get("SITEMAP_BASE", None)
-    if sitemap_base_url is None:
+    if sitemap_base_url is None and args.step is not None:
         raise_missing_env_var("SITEMAP_BASE")
 
     is_a_tty = sys.stdout.isatty()
@@ -274,34 +372,62 @@ def main():
         milliseconds=True,
     )
 
-    with logging_redirect_tqdm():
+    if args.step is None:
+        # Only check the cached courses, without running the pipeline
+        verify_requisites(cache_dir)
+        return
+
+    with (
+        logging_redirect_tqdm(),
+        http_replay.intercepting(
+            record=args.record,
+            replay=args.replay,
+            latency_ms=float(args.replay_latency_ms),
+            error_rate=float(args.replay_error_rate),
+        ),
+    ):
         if filter_step(step, "courses"):
             logger.info("Fetching course data...")
+            time_start = time.time()
+            load_parse_memo(read_requisite_parse_memo_cache(cache_dir))
             subject_to_full_subject, course_ref_to_course = courses()
 
             write_subject_to_full_subject_cache(cache_dir, subject_to_full_subject)
             write_course_ref_to_course_cache(cache_dir, course_ref_to_course)
-            logger.info("Course data fetched successfully.")
+            write_requisite_parse_memo_cache(cache_dir, dump_parse_memo())
+            retry_policy.log_metrics()
+            logger.info(f"Course data fetched successfully in {get_ms(time_start)}.")
 
         if filter_step(step, "madgrades"):
             if not madgrades_api_key:
                 raise_missing_env_var("MADGRADES_API_KEY")
 
             logger.info("Fetching madgrades data...")
+            time_start = time.time()
             course_ref_to_course = read_course_ref_to_course_cache(cache_dir)
+            course_ref_to_madgrades = (
+                read_course_ref_to_madgrades_cache(cache_dir)
+                if incremental_madgrades
+                else {}
+            )
             terms, latest_term, new_terms = madgrades(
                 course_ref_to_course=course_ref_to_course,
+                course_ref_to_madgrades=course_ref_to_madgrades,
                 madgrades_api_key=madgrades_api_key,
+                incremental=incremental_madgrades,
             )
 
             write_terms_cache(cache_dir, terms)
+            write_course_ref_to_madgrades_cache(cache_dir, course_ref_to_madgrades)
             write_course_ref_to_course_cache(cache_dir, course_ref_to_course)
             write_new_terms_cache(cache_dir, new_terms)
 
-            logger.info("Madgrades data fetched successfully.")
+            retry_policy.log_metrics()
+            logger.info(f"Madgrades data fetched successfully in {get_ms(time_start)}.")
 
         if filter_step(step, "instructors"):
             logger.info("Fetching instructor data...")
+            time_start = time.time()
 
             course_ref_to_course = read_course_ref_to_course_cache(cache_dir)
             terms = read_terms_cache(cache_dir)
@@ -317,10 +443,14 @@ def main():
             write_instructors_to_rating_cache(cache_dir, instructor_to_rating)
             write_course_ref_to_meetings_cache(cache_dir, course_ref_to_meetings)
             write_course_ref_to_course_cache(cache_dir, course_ref_to_course)
-            logger.info("Instructor data fetched successfully.")
+            retry_policy.log_metrics()
+            logger.info(
+                f"Instructor data fetched successfully in {get_ms(time_start)}."
+            )
 
         if filter_step(step, "aggregate"):
             logger.info("Aggregating data")
+            time_start = time.time()
 
             course_ref_to_course = read_course_ref_to_course_cache(cache_dir)
             instructor_to_rating = read_instructors_to_rating_cache(cache_dir)
@@ -336,6 +466,7 @@ def main():
                 course_ref_to_course=course_ref_to_course,
                 instructors=instructor_values,
                 cache_dir=cache_dir,
+                keyword_engine=args.keyword_engine,
             )
 
             course_statistics = {
@@ -349,10 +480,12 @@ def main():
             write_quick_statistics_cache(cache_dir, course_statistics)
             write_explorer_stats_cache(cache_dir, explorer_stats)
 
-            logger.info("Data aggregated successfully.")
+            inference_executor.log_metrics()
+            logger.info(f"Data aggregated successfully in {get_ms(time_start)}.")
 
         if filter_step(step, "optimize"):
             logger.info("Optimizing course data...")
+            time_start = time.time()
 
             course_ref_to_course = read_course_ref_to_course_cache(cache_dir)
 
@@ -363,10 +496,12 @@ def main():
             )
 
             write_course_ref_to_course_cache(cache_dir, course_ref_to_course)
-            logger.info("Course data optimized successfully.")
+            inference_executor.log_metrics()
+            logger.info(f"Course data optimized successfully in {get_ms(time_start)}.")
 
         if filter_step(step, "graph"):
             logger.info("Building course graph...")
+            time_start = time.time()
 
             course_ref_to_course = read_course_ref_to_course_cache(cache_dir)
 
@@ -392,7 +527,7 @@ def main():
                 color_map,
             )
 
-            logger.info("Course graph built successfully.")
+            logger.info(f"Course graph built successfully in {get_ms(time_start)}.")
 
         if not no_build:
             subject_to_full_subject = read_subject_to_full_subject_cache(cache_dir)
@@ -437,6 +572,31 @@ def main():
                 course_ref_to_meetings=course_ref_to_meetings,
             )
 
+    if args.verify_requisites:
+        verify_requisites(cache_dir)
+
+    if args.check_embedding_precision:
+        compare_model_precision(
+            cache_dir=cache_dir,
+            course_ref_to_course=read_course_ref_to_course_cache(cache_dir),
+            precision=args.embedding_precision,
+            max_prerequisites=max_prerequisites,
+        )
+
+
+def verify_requisites(cache_dir):
+    course_ref_to_course = read_course_ref_to_course_cache(cache_dir)
+    mismatches = find_tokenizer_mismatches(course_ref_to_course)
+    for course_reference in mismatches:
+        logger.error(
+            f"Requisite tokens differ from the reference for {course_reference.get_identifier()}"
+        )
+    if mismatches:
+        sys.exit(1)
+    logger.info(
+        f"Requisite tokens match the reference for all {len(course_ref_to_course)} courses."
+    )
+
 
 if __name__ == "__main__":
     main()
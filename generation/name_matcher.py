@@ -28,8 +28,9 @@ from dataclasses import dataclass
 from logging import getLogger
 from typing import Any
 
+import numpy as np
 from nameparser import HumanName
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
 logger = getLogger(__name__)
 
@@ -166,6 +167,255 @@ def calculate_name_match_score(
     return final_score
 
 
+class NameMatcher:
+    """
+    Reusable matcher over a fixed list of candidate names.
+
+    Candidates are parsed and normalized once, and bucketed by their exact normalized
+    last name. With `require_exact_last`, a query is only scored against the bucket of
+    its own last name, since every other candidate would score 0.
+
+    Scores are computed in bulk with rapidfuzz's `process.cdist`, with the same
+    weighting and threshold semantics as `calculate_name_match_score`.
+
+    Args:
+        candidates: List of candidate names
+        require_exact_last: If True, requires exact last name match
+        parsed_names: Optional mapping of candidate names to their already parsed
+            (first, last) names, to skip parsing them again
+    """
+
+    def __init__(
+        self,
+        candidates: list[str],
+        require_exact_last: bool = True,
+        parsed_names: dict[str, tuple[str, str]] | None = None,
+    ):
+        self.candidates = list(candidates)
+        self.require_exact_last = require_exact_last
+
+        self.candidate_firsts: list[str] = []
+        self.candidate_lasts: list[str] = []
+        self.last_name_buckets: dict[str, list[int]] = {}
+        for index, candidate in enumerate(self.candidates):
+            if parsed_names is not None and candidate in parsed_names:
+                candidate_first, candidate_last = parsed_names[candidate]
+            else:
+                candidate_first, candidate_last = parse_name(candidate)
+
+            self.candidate_firsts.append(candidate_first)
+            self.candidate_lasts.append(candidate_last)
+            self.last_name_buckets.setdefault(candidate_last, []).append(index)
+
+        # Candidates with an empty first or last name never match
+        self.valid_candidates = np.array(
+            [
+                bool(first and last)
+                for first, last in zip(self.candidate_firsts, self.candidate_lasts)
+            ],
+            dtype=bool,
+        )
+
+    def match(self, query_name: str, threshold: float = 80.0) -> MatchResult:
+        """
+        Find the best matching candidate name.
+
+        Args:
+            query_name: Name to match
+            threshold: Minimum confidence score (0-100) required for a match
+
+        Returns:
+            MatchResult with the best matching candidate name
+        """
+        # Validate inputs
+        if not self.candidates:
+            logger.debug(f"No candidates provided for '{query_name}'")
+            return MatchResult(matched_item=None, confidence=0.0)
+
+        query_first, query_last = parse_name(query_name)
+
+        # Validate query name was successfully parsed
+        if not query_first or not query_last:
+            logger.debug(
+                f"Invalid query name: '{query_name}' - missing first or last name"
+            )
+            return MatchResult(matched_item=None, confidence=0.0)
+
+        return self.match_parsed(query_name, query_first, query_last, threshold)
+
+    def match_parsed(
+        self,
+        query_name: str,
+        query_first: str,
+        query_last: str,
+        threshold: float = 80.0,
+    ) -> MatchResult:
+        """
+        Find the best matching candidate name for an already parsed query name.
+
+        Args:
+            query_name: Name to match, used for logging
+            query_first: Query first name (already normalized)
+            query_last: Query last name (already normalized)
+            threshold: Minimum confidence score (0-100) required for a match
+
+        Returns:
+            MatchResult with the best matching candidate name
+        """
+        indices = self._candidate_indices(query_last)
+        scores = self._score([query_first], [query_last], indices)
+        return self._best_match(query_name, scores[0], indices, threshold)
+
+    def match_many(
+        self, query_names: list[str], threshold: float = 80.0, workers: int = 1
+    ) -> list[MatchResult]:
+        """
+        Find the best matching candidate name for each of a batch of names.
+
+        Queries sharing a last name are scored against their bucket in a single
+        `process.cdist` call.
+
+        Args:
+            query_names: Names to match
+            threshold: Minimum confidence score (0-100) required for a match
+            workers: Number of threads used by rapidfuzz (-1 for all cores)
+
+        Returns:
+            List of MatchResults, in the same order as `query_names`
+        """
+        results = [MatchResult(matched_item=None, confidence=0.0) for _ in query_names]
+        if not self.candidates:
+            return results
+
+        groups: dict[str, list[tuple[int, str, str]]] = {}
+        for position, query_name in enumerate(query_names):
+            query_first, query_last = parse_name(query_name)
+            if not query_first or not query_last:
+                logger.debug(
+                    f"Invalid query name: '{query_name}' - missing first or last name"
+                )
+                continue
+            group_key = query_last if self.require_exact_last else ""
+            groups.setdefault(group_key, []).append((position, query_first, query_last))
+
+        for group_key, group in groups.items():
+            positions, query_firsts, query_lasts = map(list, zip(*group))
+            indices = self._candidate_indices(group_key)
+            scores = self._score(query_firsts, query_lasts, indices, workers)
+            for row, position in zip(scores, positions):
+                results[position] = self._best_match(
+                    query_names[position], row, indices, threshold
+                )
+
+        return results
+
+    def similar_pairs(self, threshold: float = 80.0):
+        """
+        Finds every pair of candidates that match each other.
+
+        Only candidates within the same last name bucket are compared when
+        `require_exact_last` is set.
+
+        Args:
+            threshold: Minimum confidence score (0-100) required for a match
+
+        Yields:
+            Tuples of (candidate, other candidate)
+        """
+        if self.require_exact_last:
+            blocks = self.last_name_buckets.values()
+        else:
+            blocks = [list(range(len(self.candidates)))]
+
+        for indices in blocks:
+            if len(indices) < 2:
+                continue
+            scores = self._score(
+                [self.candidate_firsts[index] for index in indices],
+                [self.candidate_lasts[index] for index in indices],
+                indices,
+            )
+            scores[~self.valid_candidates[indices], :] = 0.0
+            for i, j in zip(*np.nonzero(np.triu(scores >= threshold, k=1))):
+                yield self.candidates[indices[i]], self.candidates[indices[j]]
+
+    def _candidate_indices(self, query_last: str) -> list[int]:
+        if self.require_exact_last:
+            return self.last_name_buckets.get(query_last, [])
+        return list(range(len(self.candidates)))
+
+    def _score(
+        self,
+        query_firsts: list[str],
+        query_lasts: list[str],
+        indices: list[int],
+        workers: int = 1,
+    ) -> np.ndarray:
+        """
+        Scores queries against the candidates at `indices`.
+
+        Returns:
+            Matrix of match scores 0-100, with one row per query
+        """
+        if not indices:
+            return np.zeros((len(query_firsts), 0))
+
+        # First name fuzzy matching, see calculate_name_match_score
+        first_scores = process.cdist(
+            query_firsts,
+            [self.candidate_firsts[index] for index in indices],
+            scorer=fuzz.token_set_ratio,
+            dtype=np.float64,
+            workers=workers,
+        )
+
+        if self.require_exact_last:
+            # Every candidate in the bucket has the exact query last name
+            last_scores = np.full_like(first_scores, 100.0)
+        else:
+            last_scores = process.cdist(
+                query_lasts,
+                [self.candidate_lasts[index] for index in indices],
+                scorer=fuzz.token_set_ratio,
+                dtype=np.float64,
+                workers=workers,
+            )
+
+        # Weighted average: 70% first name, 30% last name
+        scores = (first_scores * 0.7) + (last_scores * 0.3)
+        if not self.require_exact_last:
+            scores[last_scores < 80] = 0.0  # Minimum threshold for last name
+        scores[:, ~self.valid_candidates[indices]] = 0.0
+        return scores
+
+    def _best_match(
+        self, query_name: str, scores: np.ndarray, indices: list[int], threshold: float
+    ) -> MatchResult:
+        best_match = None
+        best_score = 0.0
+
+        if scores.size:
+            # argmax picks the first candidate with the best score
+            best_position = int(np.argmax(scores))
+            if scores[best_position] > 0.0:
+                best_score = float(scores[best_position])
+                best_match = self.candidates[indices[best_position]]
+
+        # Only return match if it meets threshold
+        if best_match is None or best_score < threshold:
+            logger.debug(
+                f"No match found for '{query_name}' (best score: {best_score:.2f}, threshold: {threshold})"
+            )
+            return MatchResult(matched_item=None, confidence=best_score)
+
+        logger.debug(
+            f"Matched '{query_name}' to '{best_match}' with confidence {best_score:.2f}"
+        )
+        return MatchResult(
+            matched_item=best_match, confidence=best_score, matched_name=best_match
+        )
+
+
 def find_best_name_match(
     query_name: str,
     candidates: list[str],
@@ -175,6 +425,8 @@ def find_best_name_match(
     """
     Find the best matching name from a list of candidate names.
 
+    To match many names against the same candidates, build a NameMatcher once instead.
+
     Args:
         query_name: Name to match
         candidates: List of candidate names
@@ -184,45 +436,7 @@ def find_best_name_match(
     Returns:
         MatchResult with the best matching candidate name
     """
-    # Validate inputs
-    if not candidates:
-        logger.debug(f"No candidates provided for '{query_name}'")
-        return MatchResult(matched_item=None, confidence=0.0)
-
-    query_first, query_last = parse_name(query_name)
-
-    # Validate query name was successfully parsed
-    if not query_first or not query_last:
-        logger.debug(f"Invalid query name: '{query_name}' - missing first or last name")
-        return MatchResult(matched_item=None, confidence=0.0)
-
-    best_match = None
-    best_score = 0.0
-
-    for candidate in candidates:
-        candidate_first, candidate_last = parse_name(candidate)
-
-        score = calculate_name_match_score(
-            query_first, query_last, candidate_first, candidate_last, require_exact_last
-        )
-
-        if score > best_score:
-            best_score = score
-            best_match = candidate
-
-    # Only return match if it meets threshold
-    if best_match is None or best_score < threshold:
-        logger.debug(
-            f"No match found for '{query_name}' (best score: {best_score:.2f}, threshold: {threshold})"
-        )
-        return MatchResult(matched_item=None, confidence=best_score)
-
-    logger.debug(
-        f"Matched '{query_name}' to '{best_match}' with confidence {best_score:.2f}"
-    )
-    return MatchResult(
-        matched_item=best_match, confidence=best_score, matched_name=best_match
-    )
+    return NameMatcher(candidates, require_exact_last).match(query_name, threshold)
 
 
 def find_best_structured_match(
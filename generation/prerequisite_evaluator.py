@@ -0,0 +1,235 @@
+"""
+Answers "which courses' prerequisites do these completed courses satisfy?" for the whole
+catalog at once.
+
+Every course's requirement tree is compiled into one shared boolean circuit over
+course IDs. Since requirement trees are hash-consed, subtrees shared between courses
+become a single gate. Gates are grouped into levels by height, so evaluating the
+catalog takes one vectorized AND/OR reduction per operator and level instead of a walk
+over Python trees per course. Many sets of completed courses can be evaluated together
+as the rows of a bitset matrix.
+"""
+
+from logging import getLogger
+
+import numpy as np
+
+from course import Course
+from requirement_ast import Leaf
+
+logger = getLogger(__name__)
+
+
+class PrerequisiteEvaluator:
+    """
+    Prerequisite-satisfaction evaluator compiled from the courses' requirement trees.
+
+    Like `iter_course_combinations`, TEXT leaves are treated as satisfied, since they
+    cannot be checked against completed courses. Courses without requisites are always
+    satisfied, while courses whose requisites could not be parsed are only satisfied if
+    they reference no courses.
+    """
+
+    def __init__(self, course_ref_to_course: dict[Course.Reference, Course]):
+        self.course_refs: list[Course.Reference] = []
+        self.course_ids: dict[Course.Reference, int] = {}
+        for course_ref in sorted(
+            course_ref_to_course, key=lambda c: c.get_identifier()
+        ):
+            self._course_id(course_ref)
+
+        # Leaves, constants and gates, indexed by gate ID
+        self.gate_count = 0
+        self.leaf_gates: list[int] = []
+        self.leaf_course_ids: list[int] = []
+        self.constant_gates: dict[bool, int] = {}
+        self.gate_ids: dict[int, int] = {}
+        self.gate_heights: list[int] = []
+        # (height, operator) -> list of (gate ID, child gate IDs)
+        self.levels: dict[tuple[int, str], list[tuple[int, list[int]]]] = {}
+
+        self.catalog_refs = [
+            course_ref
+            for course_ref in self.course_refs
+            if course_ref in course_ref_to_course
+        ]
+        self.root_gates = np.array(
+            [
+                self._compile_course(course_ref_to_course[course_ref])
+                for course_ref in self.catalog_refs
+            ],
+            dtype=np.intp,
+        )
+        self._build_schedule()
+
+        logger.info(
+            f"Compiled prerequisites of {len(self.catalog_refs)} courses into "
+            f"{self.gate_count} gates over {len(self.course_refs)} course IDs "
+            f"in {len(self.schedule)} levels."
+        )
+
+    def _course_id(self, course_ref: Course.Reference) -> int:
+        course_id = self.course_ids.get(course_ref)
+        if course_id is None:
+            course_id = len(self.course_refs)
+            self.course_ids[course_ref] = course_id
+            self.course_refs.append(course_ref)
+        return course_id
+
+    def _new_gate(self, height: int) -> int:
+        gate = self.gate_count
+        self.gate_count += 1
+        self.gate_heights.append(height)
+        return gate
+
+    def _constant_gate(self, value: bool) -> int:
+        if value not in self.constant_gates:
+            self.constant_gates[value] = self._new_gate(0)
+        return self.constant_gates[value]
+
+    def _compile_course(self, course: Course) -> int:
+        prerequisites = course.prerequisites
+        if prerequisites is None:
+            return self._constant_gate(True)
+
+        tree = prerequisites.abstract_syntax_tree
+        if tree is None:
+            return self._constant_gate(not prerequisites.course_references)
+
+        return self._compile_node(tree.root)
+
+    def _compile_node(self, root) -> int:
+        """Compiles a requirement tree bottom-up, reusing the gates of shared subtrees."""
+        stack = [(root, False)]
+        while stack:
+            node, children_compiled = stack.pop()
+            if id(node) in self.gate_ids:
+                continue
+
+            if isinstance(node, Leaf):
+                if isinstance(node.payload, Course.Reference):
+                    gate = self._new_gate(0)
+                    self.leaf_gates.append(gate)
+                    self.leaf_course_ids.append(self._course_id(node.payload))
+                else:
+                    gate = self._constant_gate(True)
+                self.gate_ids[id(node)] = gate
+
+            elif not node.children:
+                self.gate_ids[id(node)] = self._constant_gate(node.operator == "AND")
+
+            elif not children_compiled:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+
+            else:
+                if node.operator not in ("AND", "OR"):
+                    raise ValueError(f"Unknown operator {node.operator!r}")
+
+                children = [self.gate_ids[id(child)] for child in node.children]
+                height = 1 + max(self.gate_heights[child] for child in children)
+                gate = self._new_gate(height)
+                self.levels.setdefault((height, node.operator), []).append(
+                    (gate, children)
+                )
+                self.gate_ids[id(node)] = gate
+
+        return self.gate_ids[id(root)]
+
+    def _build_schedule(self):
+        """Flattens each level into index arrays for `np.logical_and/or.reduceat`."""
+        self.schedule = []
+        for height, operator in sorted(self.levels):
+            gates = self.levels[(height, operator)]
+            children = np.array(
+                [child for _, gate_children in gates for child in gate_children],
+                dtype=np.intp,
+            )
+            offsets = np.cumsum([0] + [len(c) for _, c in gates[:-1]], dtype=np.intp)
+            reduce = np.logical_and if operator == "AND" else np.logical_or
+            self.schedule.append(
+                (
+                    np.array([gate for gate, _ in gates], dtype=np.intp),
+                    children,
+                    offsets,
+                    reduce,
+                )
+            )
+
+        self.leaf_gates = np.array(self.leaf_gates, dtype=np.intp)
+        self.leaf_course_ids = np.array(self.leaf_course_ids, dtype=np.intp)
+
+    def to_bitset(self, course_refs) -> np.ndarray:
+        """
+        Args:
+            course_refs: Course.References; ones unknown to the evaluator are ignored
+
+        Returns:
+            Boolean vector over course IDs
+        """
+        bitset = np.zeros(len(self.course_refs), dtype=bool)
+        for course_ref in course_refs:
+            course_id = self.course_ids.get(course_ref)
+            if course_id is not None:
+                bitset[course_id] = True
+        return bitset
+
+    def satisfied(self, completed: np.ndarray) -> np.ndarray:
+        """
+        Evaluates every course's prerequisites.
+
+        Args:
+            completed: Boolean bitsets over course IDs, either a single vector or a
+                matrix with one set of completed courses per row
+
+        Returns:
+            Booleans aligned to `catalog_refs`, with the same leading shape as `completed`
+        """
+        completed = np.asarray(completed, dtype=bool)
+        values = np.empty(completed.shape[:-1] + (self.gate_count,), dtype=bool)
+        values[..., self.leaf_gates] = completed[..., self.leaf_course_ids]
+        for value, gate in self.constant_gates.items():
+            values[..., gate] = value
+
+        for gates, children, offsets, reduce in self.schedule:
+            values[..., gates] = reduce.reduceat(
+                values[..., children], offsets, axis=-1
+            )
+
+        return values[..., self.root_gates]
+
+    def satisfied_by(
+        self, course_ref_to_completed: dict, chunk_size: int = 256
+    ) -> dict[Course.Reference, bool]:
+        """
+        Evaluates the prerequisites of each given course against its own set of completed
+        courses, e.g. to check that a chosen set of prerequisites satisfies the
+        requisites it was chosen from.
+
+        Args:
+            course_ref_to_completed: Mapping of catalog courses to the completed courses
+                to evaluate their prerequisites with
+            chunk_size: Courses evaluated together, as the rows of one bitset matrix
+
+        Returns:
+            Mapping of the given catalog courses to whether their prerequisites are
+            satisfied
+        """
+        positions = {course_ref: i for i, course_ref in enumerate(self.catalog_refs)}
+        course_refs = [
+            course_ref
+            for course_ref in course_ref_to_completed
+            if course_ref in positions
+        ]
+
+        result = {}
+        for start in range(0, len(course_refs), chunk_size):
+            chunk = course_refs[start : start + chunk_size]
+            completed = np.array(
+                [self.to_bitset(course_ref_to_completed[c]) for c in chunk]
+            ).reshape(len(chunk), len(self.course_refs))
+            satisfied = self.satisfied(completed)[
+                np.arange(len(chunk)), [positions[c] for c in chunk]
+            ]
+            result.update(zip(chunk, satisfied.tolist()))
+        return result
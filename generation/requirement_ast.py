@@ -1,8 +1,11 @@
+import json
 import re
-from typing import Union
+from logging import getLogger
 
 from json_serializable import JsonSerializable
 
+logger = getLogger(__name__)
+
 token_specs = [
     (r"\(", "LPAREN"),
     (r"\)", "RPAREN"),
@@ -208,7 +211,155 @@ def filter_tokens(tokens):
     return res
 
 
+def lex_requisites(linked_requisite_text):
+    """
+    Splits wrapped requisite text into tokens, inferring each comma's operator on the
+    way (see `infer_commas`).
+
+    A comma takes the first operator that follows it at the same parenthesis depth,
+    so commas are emitted as AND placeholders and patched once that operator is
+    reached, instead of rescanning the remaining tokens for every comma.
+    """
+    from course import Course
+
+    tokens = []
+    depth = 0
+    depth_to_pending_commas = {}
+
+    def add_token(kind, value):
+        nonlocal depth
+        if kind == "LPAREN":
+            depth += 1
+        elif kind == "RPAREN":
+            depth -= 1
+        elif kind in ("AND", "OR"):
+            for index in depth_to_pending_commas.pop(depth, ()):
+                tokens[index] = (kind, tokens[index][1])
+        elif kind == "COMMA":
+            depth_to_pending_commas.setdefault(depth, []).append(len(tokens))
+            kind = "AND"
+        tokens.append((kind, value))
+
+    for piece in linked_requisite_text:
+        if isinstance(piece, Course.Reference):
+            add_token("COURSE", piece)
+            continue
+
+        position = 0
+        for match in tokenizer_re.finditer(piece):
+            if position < match.start() and piece[position : match.start()].strip():
+                add_token("TEXT", piece[position : match.start()].strip())
+
+            token_type = match.lastgroup
+            add_token(token_type, match.group(token_type))
+            position = match.end()
+
+        if position < len(piece) and piece[position:].strip():
+            add_token("TEXT", piece[position:].strip())
+
+    return tokens
+
+
+def normalize_operators(tokens):
+    """
+    Hoists group operators and collapses consecutive identical operators in one pass,
+    equivalent to `hoist_group_operators` followed by `collapse_operators`.
+    """
+    out = []
+    last_operator = None
+
+    def add_token(kind, value):
+        nonlocal last_operator
+        if kind in ("AND", "OR"):
+            if last_operator != kind:
+                out.append((kind, value))
+                last_operator = kind
+        else:
+            out.append((kind, value))
+            last_operator = None
+
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        if (
+            kind == "LPAREN"
+            and i + 1 < len(tokens)
+            and tokens[i + 1][0] in ("AND", "OR")
+        ):
+            op_kind, op_value = tokens[i + 1]
+            if out and out[-1][0] not in ("LPAREN", "AND", "OR"):
+                add_token(op_kind, op_value)
+            add_token(kind, value)
+            i += 2
+        else:
+            add_token(kind, value)
+            i += 1
+
+    return out
+
+
+def filter_excluded_groups(tokens):
+    """
+    Drops groups and runs containing a negation phrase, equivalent to `filter_tokens`.
+
+    Matching parentheses, the next group of each token and a prefix count of negated
+    TEXT tokens are computed up front, so each token is visited once. Token lists with
+    unmatched parentheses fall back to `filter_tokens`.
+    """
+    n = len(tokens)
+    matching = {}
+    open_groups = []
+    negations = [0] * (n + 1)
+    for i, (kind, text) in enumerate(tokens):
+        if kind == "LPAREN":
+            open_groups.append(i)
+        elif kind == "RPAREN" and open_groups:
+            matching[open_groups.pop()] = i
+        negations[i + 1] = negations[i] + (
+            kind == "TEXT" and exclusion_re.search(text) is not None
+        )
+
+    if open_groups:
+        return filter_tokens(tokens)
+
+    next_group = [n] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        next_group[i] = i if tokens[i][0] == "LPAREN" else next_group[i + 1]
+
+    res = []
+
+    def _filter(start, end):
+        i = start
+        while i < end:
+            if tokens[i][0] == "LPAREN":
+                close = matching[i]
+                if negations[close] == negations[i + 1]:
+                    res.append(tokens[i])  # keep LPAREN
+                    _filter(i + 1, close)  # recurse inside
+                    res.append(tokens[close])  # keep RPAREN
+                i = close + 1  # jump past this group
+            else:
+                # plain run up to next LPAREN
+                j = min(next_group[i], end)
+                if negations[j] == negations[i]:
+                    res.extend(tokens[i:j])
+                i = j
+
+    _filter(0, n)
+    return res
+
+
 def tokenize_requisites(linked_requisite_text):
+    tokens = lex_requisites(wrap_sentences(linked_requisite_text))
+    tokens = normalize_operators(tokens)
+    return filter_excluded_groups(tokens)
+
+
+def tokenize_requisites_reference(linked_requisite_text):
+    """
+    Multi-pass reference implementation of `tokenize_requisites`, kept to verify the
+    single-pass tokenizer against.
+    """
     from course import Course
 
     linked_requisite_text = wrap_sentences(linked_requisite_text)
@@ -240,6 +391,31 @@ def tokenize_requisites(linked_requisite_text):
     return tokens
 
 
+def find_tokenizer_mismatches(course_ref_to_course) -> list:
+    """
+    Compares `tokenize_requisites` against the multi-pass reference on every course's
+    requisite text.
+
+    Returns:
+        List of course references whose tokens differ
+    """
+    from course import Course
+
+    mismatches = []
+    for course_reference, course in course_ref_to_course.items():
+        if not course.prerequisites:
+            continue
+        linked_requisite_text = [
+            Course.Reference.from_json(piece) if isinstance(piece, dict) else piece
+            for piece in course.prerequisites.linked_requisite_text
+        ]
+        if tokenize_requisites(linked_requisite_text) != tokenize_requisites_reference(
+            linked_requisite_text
+        ):
+            mismatches.append(course_reference)
+    return mismatches
+
+
 class Leaf(JsonSerializable):
     def __init__(self, payload: JsonSerializable | str):
         self.payload = payload
@@ -265,12 +441,12 @@ class Leaf(JsonSerializable):
 
 
 class Node(JsonSerializable):
-    def __init__(self, operator: str, children: list[Union["Node", Leaf]]):
+    def __init__(self, operator: str, children: list["Node | Leaf"]):
         self.operator = operator
         self.children = children
 
     @classmethod
-    def from_json(cls, json_data) -> "Union[Node, Leaf]":
+    def from_json(cls, json_data) -> "Node | Leaf":
         if isinstance(json_data, dict):
             operator = json_data.get("operator")
             if operator is None:
@@ -295,8 +471,28 @@ class Node(JsonSerializable):
         return _tree_repr(self, is_root=True)
 
 
+# Hash-consing table of canonical nodes, keyed by operator and canonical children
+_interned_nodes: dict[tuple, Node | Leaf] = {}
+
+
+def intern_node(node: Node | Leaf) -> Node | Leaf:
+    """
+    Returns the canonical node structurally identical to `node`, so that identical
+    subtrees across courses are shared objects. Canonical nodes must not be mutated.
+    """
+    if isinstance(node, Leaf):
+        key = ("LEAF", node.payload)
+    else:
+        children = [intern_node(child) for child in node.children]
+        key = (node.operator, tuple(id(child) for child in children))
+        if key not in _interned_nodes:
+            node = Node(node.operator, children)
+
+    return _interned_nodes.setdefault(key, node)
+
+
 def _tree_repr(
-    node: Union[Node, Leaf],
+    node: Node | Leaf,
     prefix: str = "",
     is_last: bool = True,
     is_root: bool = False,
@@ -322,15 +518,15 @@ def _tree_repr(
 
 
 class RequirementAbstractSyntaxTree(JsonSerializable):
-    def __init__(self, root: Union[Node, Leaf]):
+    def __init__(self, root: Node | Leaf):
         self.root = root
 
     @classmethod
     def from_json(cls, json_data):
         if isinstance(json_data, dict):
-            return cls(Node.from_json(json_data))
+            return cls(intern_node(Node.from_json(json_data)))
         elif isinstance(json_data, str):
-            return cls(Leaf(json_data))
+            return cls(intern_node(Leaf(json_data)))
         else:
             return None
 
@@ -345,48 +541,63 @@ class RequirementAbstractSyntaxTree(JsonSerializable):
         return _tree_repr(self.root, is_root=True)
 
     def course_combinations(self):
-        def _recurse(node):
-            # Leaf case
-            if isinstance(node, Leaf):
-                if not isinstance(node.payload, str):
-                    # it's a Course.Reference
-                    return [[node.payload]]
+        return list(self.iter_course_combinations())
+
+    def iter_course_combinations(self, prune=None):
+        """
+        Lazily yields every distinct, non-empty combination of courses satisfying the
+        tree, walking it depth first instead of materializing every AND's Cartesian
+        product.
+
+        Args:
+            prune: Optional callback taking (chosen course references, pending nodes)
+                for a partial combination, returning True to skip every combination
+                extending it
+
+        Yields:
+            Lists of Course.References, in the order of the tree's branches
+        """
+        seen = set()
+        stack = [((), (self.root,))]
+        while stack:
+            chosen, pending = stack.pop()
+            if prune is not None and prune(chosen, pending):
+                continue
+
+            while pending:
+                node, rest = pending[0], pending[1:]
+
+                # Leaf case
+                if isinstance(node, Leaf):
+                    if not isinstance(node.payload, str):
+                        # it's a Course.Reference
+                        chosen += (node.payload,)
+                    # a TEXT leaf contributes no courses
+                    pending = rest
+
+                # Node case
+                elif node.operator == "AND":
+                    # every child's courses are needed
+                    pending = tuple(node.children) + rest
+
+                elif node.operator == "OR":
+                    # any one child's courses will do, explored in order
+                    stack.extend(
+                        (chosen, (child,) + rest) for child in reversed(node.children)
+                    )
+                    break
+
                 else:
-                    # a TEXT leaf: contributes no courses
-                    return [[]]
-
-            # Node case
-            assert isinstance(node, Node)
-            if node.operator == "AND":
-                combos = [[]]  # start with an “empty” combo
-                for child in node.children:
-                    child_combos = _recurse(child)
-                    # Cartesian product: append every child-combo to every existing combo
-                    combos = [prev + curr for prev in combos for curr in child_combos]
-                return combos
-
-            elif node.operator == "OR":
-                # any one child’s combos will do
-                combos = []
-                for child in node.children:
-                    combos.extend(_recurse(child))
-                return combos
+                    raise ValueError(f"Unknown operator {node.operator!r}")
 
             else:
-                raise ValueError(f"Unknown operator {node.operator!r}")
-
-        raw = _recurse(self.root)
-        # option 1: drop any empty combos (if you only want actual course sets)
-        nonempty = [combo for combo in raw if combo]
-        # option 2: dedupe (set of tuples) and preserve order
-        seen = set()
-        unique = []
-        for combo in nonempty:
-            key = tuple(sorted(combo, key=lambda cr: str(cr)))
-            if key not in seen:
-                seen.add(key)
-                unique.append(combo)
-        return unique
+                # drop empty combos and dedupe, preserving order
+                if not chosen:
+                    continue
+                key = tuple(sorted(chosen, key=lambda cr: str(cr)))
+                if key not in seen:
+                    seen.add(key)
+                    yield list(chosen)
 
 
 class RequirementParser:
@@ -396,7 +607,7 @@ class RequirementParser:
 
     def parse(self) -> RequirementAbstractSyntaxTree:
         root = self.parse_or()
-        return RequirementAbstractSyntaxTree(root)
+        return RequirementAbstractSyntaxTree(intern_node(root))
 
     def parse_or(self):
         children = [self.parse_and()]
@@ -443,3 +654,85 @@ class RequirementParser:
 
     def _peek_kind(self):
         return self.tokens[self.pos][0] if self.pos < len(self.tokens) else "EOF"
+
+
+# Bump when tokenizing or parsing changes, to discard memoized parses
+parse_memo_version = 1
+
+# Memo of parsed requisites, keyed by normalized linked requisite text
+_parse_memo: dict[str, tuple[RequirementAbstractSyntaxTree | None, str | None]] = {}
+# Memo keys parsed in this run, the only ones persisted by `dump_parse_memo`
+_used_parse_keys: set[str] = set()
+
+
+def requisite_parse_key(linked_requisite_text) -> str:
+    """
+    Normalizes linked requisite text into a memo key, with course references replaced
+    by their identifiers.
+    """
+    from course import Course
+
+    return json.dumps(
+        [
+            ["COURSE", piece.get_identifier()]
+            if isinstance(piece, Course.Reference)
+            else ["TEXT", piece]
+            for piece in linked_requisite_text
+        ]
+    )
+
+
+def parse_requisites(
+    linked_requisite_text,
+) -> tuple[RequirementAbstractSyntaxTree | None, str | None]:
+    """
+    Tokenizes and parses linked requisite text, reusing the parse of identical text.
+
+    Returns:
+        Tuple of (abstract syntax tree, or None if the text could not be parsed,
+        syntax error message, or None if the text was parsed)
+    """
+    key = requisite_parse_key(linked_requisite_text)
+    _used_parse_keys.add(key)
+    memoized = _parse_memo.get(key)
+    if memoized is not None:
+        return memoized
+
+    tokens = tokenize_requisites(linked_requisite_text)
+    try:
+        result = (RequirementParser(tokens).parse(), None)
+    except SyntaxError as se:
+        result = (None, str(se))
+
+    _parse_memo[key] = result
+    return result
+
+
+def load_parse_memo(json_data):
+    """Loads memoized parses persisted by `dump_parse_memo`, unless outdated."""
+    if not json_data or json_data.get("version") != parse_memo_version:
+        return
+
+    for key, entry in json_data["parses"].items():
+        _parse_memo[key] = (
+            RequirementAbstractSyntaxTree.from_json(entry["tree"])
+            if entry["tree"] is not None
+            else None,
+            entry["error"],
+        )
+    logger.info(f"Loaded {len(json_data['parses'])} memoized requisite parses.")
+
+
+def dump_parse_memo():
+    """
+    Dumps the memoized parses of the requisites parsed in this run, so that parses of
+    requisite text that no longer appears in any course are dropped.
+    """
+    return {
+        "version": parse_memo_version,
+        "parses": {
+            key: {"tree": tree.to_dict() if tree else None, "error": error}
+            for key, (tree, error) in _parse_memo.items()
+            if key in _used_parse_keys
+        },
+    }
@@ -0,0 +1,251 @@
+"""
+Shared async retry policy for all upstream fetchers.
+
+Every fetcher wraps its request in `retry_policy.call`, which provides:
+- Exponential backoff with full jitter between attempts
+- A per-host retry budget, so retries stay a bounded fraction of requests
+- A per-host circuit breaker, so a degraded upstream is backed off from instead of
+  being hammered by every in-flight request
+- Per-host metrics, logged at the end of each step
+"""
+
+import asyncio
+import random
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from logging import getLogger
+from urllib.parse import urlsplit
+
+logger = getLogger(__name__)
+
+retryable_statuses = {429, 500, 502, 503, 504}
+
+
+class RetryableStatusError(Exception):
+    """Raised for HTTP responses whose status indicates the request may be retried."""
+
+    def __init__(self, status: int, url, retry_after: float | None = None):
+        super().__init__(f"Received retryable status {status} from {url}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def raise_for_retryable_status(response):
+    """
+    Raises RetryableStatusError if the response has a retryable status code.
+
+    Args:
+        response: aiohttp (or cached) response
+    """
+    if response.status in retryable_statuses:
+        raise RetryableStatusError(
+            response.status,
+            response.url,
+            parse_retry_after(response.headers.get("Retry-After")),
+        )
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens, and callers wait
+    `reset_timeout` seconds before a single probe request is let through. A successful
+    probe closes the circuit, while a failed one opens it again.
+    """
+
+    def __init__(self, host: str, failure_threshold: int = 20, reset_timeout=30.0):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    async def acquire(self) -> bool:
+        """
+        Waits until a request may be sent to the host.
+
+        Returns:
+            True if the caller was let through as the probe of an open circuit, and
+            must record its outcome (or its cancellation as a failure)
+        """
+        while self.opened_at is not None:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            elif not self.probing:
+                self.probing = True
+                return True
+            else:
+                await asyncio.sleep(1)
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.host} closed.")
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> bool:
+        """
+        Records a failed request.
+
+        Returns:
+            True if this failure opened the circuit
+        """
+        self.consecutive_failures += 1
+        if self.probing or (
+            self.opened_at is None
+            and self.consecutive_failures >= self.failure_threshold
+        ):
+            self.opened_at = time.monotonic()
+            self.probing = False
+            logger.warning(
+                f"Circuit for {self.host} opened after {self.consecutive_failures} consecutive failures, "
+                f"backing off for {self.reset_timeout} seconds."
+            )
+            return True
+        return False
+
+
+class RetryPolicy:
+    """
+    Retry policy shared by every fetcher, with per-host circuit breakers, retry budgets
+    and metrics.
+
+    Args:
+        attempts: Default number of attempts per call, including the first
+        base_delay: Backoff ceiling in seconds before the first retry
+        max_delay: Maximum backoff ceiling in seconds
+        budget_ratio: Retries allowed per host as a fraction of its requests
+        min_budget: Retries always allowed per host, regardless of request count
+        failure_threshold: Consecutive failures that open a host's circuit
+        reset_timeout: Seconds an open circuit waits before probing again
+    """
+
+    def __init__(
+        self,
+        attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        budget_ratio: float = 0.2,
+        min_budget: int = 100,
+        failure_threshold: int = 20,
+        reset_timeout: float = 30.0,
+    ):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.min_budget = min_budget
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.metrics: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(
+                host, self.failure_threshold, self.reset_timeout
+            )
+        return self.breakers[host]
+
+    def backoff(self, retry: int) -> float:
+        """Full-jitter exponential backoff for the given retry number (starting at 0)."""
+        ceiling = min(self.max_delay, self.base_delay * 2**retry)
+        return random.uniform(0, ceiling)
+
+    def has_budget(self, host: str) -> bool:
+        metrics = self.metrics[host]
+        budget = self.min_budget + self.budget_ratio * metrics["requests"]
+        return metrics["retries"] < budget
+
+    async def call(self, operation, url, attempts: int | None = None):
+        """
+        Runs `operation` with retries.
+
+        Args:
+            operation: Zero-argument coroutine function performing the request; any
+                exception it raises is treated as a failed attempt
+            url: URL being requested, used to select the host's breaker and budget
+            attempts: Number of attempts, including the first (defaults to the policy's)
+
+        Returns:
+            The result of the first successful attempt
+
+        Raises:
+            The exception of the last failed attempt, once attempts or the host's retry
+            budget are exhausted
+        """
+        host = urlsplit(str(url)).hostname or str(url)
+        breaker = self.breaker(host)
+        metrics = self.metrics[host]
+        attempts = attempts or self.attempts
+
+        for attempt in range(attempts):
+            is_probe = await breaker.acquire()
+            metrics["requests"] += 1
+            try:
+                result = await operation()
+            except Exception as e:
+                metrics["failures"] += 1
+                if isinstance(e, RetryableStatusError) and e.status == 429:
+                    metrics["rate_limited"] += 1
+                if breaker.record_failure():
+                    metrics["circuit_opens"] += 1
+
+                if attempt + 1 >= attempts:
+                    raise
+                if not self.has_budget(host):
+                    metrics["budget_exhausted"] += 1
+                    logger.debug(f"Retry budget for {host} exhausted: {e}")
+                    raise
+
+                delay = self.backoff(attempt)
+                if isinstance(e, RetryableStatusError) and e.retry_after:
+                    delay = max(delay, min(e.retry_after, self.max_delay))
+                metrics["retries"] += 1
+                logger.debug(
+                    f"Attempt {attempt + 1}/{attempts} for {url} failed: {e}. Retrying in {delay:.2f} seconds..."
+                )
+                await asyncio.sleep(delay)
+            except BaseException:
+                # A cancelled probe must still reopen the circuit, or every later
+                # caller would wait for a probe that never finishes
+                if is_probe:
+                    breaker.record_failure()
+                raise
+            else:
+                breaker.record_success()
+                metrics["successes"] += 1
+                return result
+
+    def log_metrics(self, reset=True):
+        for host, metrics in sorted(self.metrics.items()):
+            logger.info(
+                f"Requests to {host}: "
+                + ", ".join(
+                    f"{name}={count}" for name, count in sorted(metrics.items())
+                )
+            )
+        if reset:
+            self.metrics.clear()
+
+
+retry_policy = RetryPolicy()
@@ -5,6 +5,7 @@ from zoneinfo import ZoneInfo
 from collections import defaultdict
 from logging import getLogger
 
+import numpy as np
 from tqdm import tqdm
 
 from instructors import FullInstructor
@@ -464,6 +465,28 @@ def write_file(directory, directory_tuple: tuple[str, ...], filename: str, data)
     logger.debug(f"Data written to {file_path} ({readable_size})")
 
 
+def write_arrays(directory, directory_tuple: tuple[str, ...], filename: str, arrays):
+    """
+    Writes a dictionary of numpy arrays to an .npz file.
+    - directory_tuple: Tuple representing the directory path.
+    - filename: Name of the file (without the .npz extension).
+    - arrays: Dictionary of array names to arrays.
+    """
+    directory_path = os.path.join(directory, *directory_tuple)
+    os.makedirs(directory_path, exist_ok=True)
+
+    sanitized_filename = filename.replace("/", "_").replace(" ", "_")
+    file_path = os.path.join(directory_path, f"{sanitized_filename}.npz")
+
+    # np.savez appends .npz to file names, but not to open files
+    with open(file_path, "wb") as arrays_file:
+        np.savez(arrays_file, **arrays)
+
+    file_size = os.path.getsize(file_path)
+    readable_size = format_file_size(file_size)
+    logger.debug(f"Arrays written to {file_path} ({readable_size})")
+
+
 def write_geojson_file(
     directory, directory_tuple: tuple[str, ...], filename: str, geojson_data
 ):
@@ -0,0 +1,42 @@
+class UnionFind:
+    """
+    Disjoint-set forest with path halving and union by size.
+
+    Elements are added lazily the first time they are seen.
+    """
+
+    def __init__(self, elements=()):
+        self.parent = {}
+        self.size = {}
+        for element in elements:
+            self.add(element)
+
+    def add(self, element):
+        if element not in self.parent:
+            self.parent[element] = element
+            self.size[element] = 1
+
+    def find(self, element):
+        self.add(element)
+        while self.parent[element] != element:
+            self.parent[element] = self.parent[self.parent[element]]
+            element = self.parent[element]
+        return element
+
+    def union(self, a, b):
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+    def groups(self) -> list[list]:
+        """Returns the members of every set, in insertion order."""
+        root_to_members = {}
+        for element in self.parent:
+            root_to_members.setdefault(self.find(element), []).append(element)
+        return list(root_to_members.values())
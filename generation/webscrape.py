@@ -1,16 +1,15 @@
-import asyncio
 import re
 import time
 from logging import getLogger
 
 import aiohttp
 import requests
-from aiohttp_client_cache import CachedSession
 from bs4 import BeautifulSoup, ResultSet
 from tqdm.asyncio import tqdm
 
-from aio_cache import get_aio_cache
+from aio_cache import CoalescingCachedSession, get_aio_cache
 from course import Course
+from retry_policy import raise_for_retryable_status, retry_policy
 from timer import get_ms
 
 sitemap_url = "https://guide.wisc.edu/sitemap.xml"
@@ -19,26 +18,30 @@ logger = getLogger(__name__)
 
 
 async def get_course_blocks(session, url: str) -> (str, ResultSet):
+    async def fetch_course_blocks():
+        time_start = time.time()
+        async with session.get(url) as response:
+            raise_for_retryable_status(response)
+            content = await response.read()
+        soup = BeautifulSoup(content, "html.parser")
+
+        subject_title = soup.find(class_="page-title").get_text(strip=True)
+        results = soup.find_all("div", class_="courseblock")
+
+        time_elapsed_ms = get_ms(time_start)
+        logger.debug(
+            f"Discovered {len(results)} courses for {subject_title} in {time_elapsed_ms}ms"
+        )
+        return subject_title, results
+
     attempts = 5
-    for attempt in range(1, attempts + 1):
-        try:
-            time_start = time.time()
-            async with session.get(url) as response:
-                content = await response.read()
-            soup = BeautifulSoup(content, "html.parser")
-
-            subject_title = soup.find(class_="page-title").get_text(strip=True)
-            results = soup.find_all("div", class_="courseblock")
-
-            time_elapsed_ms = get_ms(time_start)
-            logger.debug(
-                f"Discovered {len(results)} courses for {subject_title} in {time_elapsed_ms}ms"
-            )
-            return subject_title, results
-        except Exception as e:
-            logger.error(f"Attempt {attempt} failed for URL {url}: {e}")
-            await asyncio.sleep(1)  # Wait 1 second before retrying
-    raise Exception(f"Failed to fetch data from {url} after {attempts} attempts.")
+    try:
+        return await retry_policy.call(fetch_course_blocks, url, attempts=attempts)
+    except Exception as e:
+        logger.error(f"Failed to fetch data from {url}: {e}")
+        raise Exception(
+            f"Failed to fetch data from {url} after {attempts} attempts."
+        ) from e
 
 
 def add_data(subjects, course_ref_course, full_subject, blocks):
@@ -92,7 +95,7 @@ async def scrape_all(urls: set[str]):
     timeout = aiohttp.ClientTimeout(total=60)
     connector = aiohttp.TCPConnector(limit=10)
 
-    async with CachedSession(
+    async with CoalescingCachedSession(
         cache=get_aio_cache(), timeout=timeout, connector=connector
     ) as session:
         tasks = [get_course_blocks(session, url) for url in urls]